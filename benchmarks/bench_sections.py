@@ -0,0 +1,59 @@
+#! /usr/bin/env python3
+'''Benchmark the native section parser against the ciscoconfparse parser on a large generated indented configuration'''
+import argparse
+import logging
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from orphanreaper import sections
+
+def generate_lines(line_count):
+  '''Generate an NX-OS style configuration of roughly line_count lines with nested indented sections'''
+  lines = []
+  section_number = 0
+  while len(lines) < line_count:
+    lines.append('interface Ethernet1/%s' % section_number)
+    lines.append('  description generated section %s' % section_number)
+    lines.append('  ip address 10.%s.%s.1/30' % (section_number // 256 % 256, section_number % 256))
+    lines.append('  no shutdown')
+    lines.append('router bgp %s' % section_number)
+    lines.append('  neighbor 192.0.2.%s' % (section_number % 256))
+    lines.append('    address-family ipv4 unicast')
+    lines.append('      route-map RM-%s in' % section_number)
+    section_number += 1
+  return lines[:line_count]
+
+def best_of(repeat, function):
+  '''Return the fastest of repeat timed calls of function, in seconds'''
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    function()
+    timings.append(time.perf_counter() - start)
+  return min(timings)
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--lines', type=int, nargs='+', default=[10000, 100000, 500000], help="Configuration sizes to benchmark, in lines")
+  parser.add_argument('--repeat', type=int, default=3, help="Number of timed runs per size, the fastest is reported")
+  args = parser.parse_args()
+  try:
+    import ciscoconfparse
+  except ImportError:
+    ciscoconfparse = None
+    print("ciscoconfparse is not installed, only the native parser is benchmarked")
+  # ciscoconfparse logs a notice on every construction
+  logging.disable(logging.WARNING)
+  print("%10s %12s %16s %8s" % ('lines', 'native (s)', 'ciscoconfparse (s)', 'speedup'))
+  for line_count in args.lines:
+    lines = generate_lines(line_count)
+    native = best_of(args.repeat, lambda: sections.build_hierarchy(lines, 'indent'))
+    if ciscoconfparse:
+      fallback = best_of(args.repeat, lambda: sections.hierarchy_from_ciscoconfparse(ciscoconfparse.CiscoConfParse(config=lines), lines))
+      print("%10s %12.3f %16.3f %7.1fx" % (line_count, native, fallback, fallback / native))
+    else:
+      print("%10s %12.3f %16s %8s" % (line_count, native, '-', '-'))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,158 @@
+#! /usr/bin/env python3
+'''Benchmark template loading, object and reference discovery, orphan detection and full cli.py runs on synthetic configurations
+of increasing size.  Results are printed as a table and can be saved as JSON and compared against a previous run'''
+import argparse
+import concurrent.futures
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+from orphanreaper import config
+from orphanreaper import templates
+import synth
+
+PHASES = ('load', 'get_objects', 'get_references', 'get_orphans', 'cli')
+
+def best_of(repeat, function):
+  '''Return the fastest of repeat timed calls of function, in seconds'''
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    function()
+    timings.append(time.perf_counter() - start)
+  return min(timings)
+
+def load_templates():
+  reaper_config = config.Config(None, os.path.join(ROOT_DIR, 'conf', 'reaper.cfg.defaults.yaml'))
+  reaper_config.load()
+  loaded = templates.Templates(reaper_config)
+  loaded.load()
+  return loaded
+
+def run_cli(template_slug, config_file):
+  '''Run cli.py on one file without the result cache, returning (seconds, peak RSS in bytes) of the child process.  On Linux the peak
+  RSS of a child starts from that of the process it was forked from, so this must be called from a process which never held the
+  generated lines'''
+  start = time.perf_counter()
+  process = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, 'cli.py'), '--defaults', '--no-cache', '-q', '%s:%s' % (template_slug, config_file)])
+  pid, status, usage = os.wait4(process.pid, 0)
+  seconds = time.perf_counter() - start
+  if status:
+    raise RuntimeError("cli.py exited with status %s" % status)
+  return seconds, usage.ru_maxrss * 1024
+
+def bench_size(line_count, args, config_file=None):
+  '''Benchmark one configuration size.  Runs in a fresh process so that peak RSS belongs to this size only.  The generated lines are
+  written to config_file if one is given, for full cli.py runs'''
+  logging.disable(logging.WARNING)
+  os.chdir(ROOT_DIR)
+  template = synth.load_template(args.template)
+  lines, orphans = synth.generate(template, line_count, int(line_count * args.object_ratio), args.reference_density, args.orphan_ratio, args.seed)
+  expected_orphans = sum(len(names) for names in orphans.values())
+  slug = template['meta']['slug']
+  loaded = load_templates()
+  new_file = lambda: {'filename': 'synthetic', 'template': slug, 'lines': lines}
+  seconds = {
+    'load': best_of(args.repeat, load_templates),
+    'get_objects': best_of(args.repeat, lambda: loaded.get_objects(new_file())),
+    'get_references': best_of(args.repeat, lambda: loaded.get_references(new_file())),
+    'get_orphans': best_of(args.repeat, lambda: loaded.get_orphans(new_file())),
+  }
+  found_orphans = sum(len(names) for names in loaded.get_orphans(new_file()).values())
+  peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+  if config_file:
+    with open(config_file, 'w') as f:
+      f.writelines(line + '\n' for line in lines)
+  return {
+    'lines': len(lines),
+    'objects': int(line_count * args.object_ratio),
+    'expected_orphans': expected_orphans,
+    'found_orphans': found_orphans,
+    'peak_rss_bytes': peak_rss,
+    'cli_peak_rss_bytes': None,
+    'phases': {phase: {'seconds': phase_seconds, 'lines_per_sec': len(lines) / phase_seconds if phase != 'load' else None} for phase, phase_seconds in seconds.items()},
+  }
+
+def compare(results, baseline_file, threshold):
+  '''Print phases which are more than threshold times slower than in the baseline results.  Returns the number of regressions'''
+  with open(baseline_file) as f:
+    baseline = {result['lines']: result for result in json.load(f)['results']}
+  regressions = 0
+  for result in results:
+    if result['lines'] not in baseline:
+      continue
+    for phase, timing in result['phases'].items():
+      baseline_timing = baseline[result['lines']]['phases'].get(phase)
+      if not baseline_timing:
+        continue
+      ratio = timing['seconds'] / baseline_timing['seconds']
+      if ratio > threshold:
+        regressions += 1
+        print("REGRESSION %s lines %s: %.4fs -> %.4fs (%.2fx)" % (result['lines'], phase, baseline_timing['seconds'], timing['seconds'], ratio))
+  return regressions
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000], help="Configuration sizes to benchmark, in lines")
+  parser.add_argument('--template', default=os.path.join(ROOT_DIR, 'templates', 'nxos.yaml'), help="Template whose objects are generated.  Its slug must be loaded by the default configuration")
+  parser.add_argument('--object-ratio', type=float, default=0.05, help="Objects defined per line of configuration")
+  parser.add_argument('--reference-density', type=float, default=1.0, help="Average number of references to each referenced object")
+  parser.add_argument('--orphan-ratio', type=float, default=0.1, help="Fraction of objects generated without references")
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--repeat', type=int, default=3, help="Number of timed runs per phase, the fastest is reported")
+  parser.add_argument('--skip-cli', action='store_true', help="Do not time full cli.py runs")
+  parser.add_argument('--json', default=None, help="Save results as JSON to this file")
+  parser.add_argument('--compare', default=None, help="JSON results of a previous run to compare against")
+  parser.add_argument('--threshold', type=float, default=1.25, help="Slowdown ratio reported as a regression by --compare")
+  args = parser.parse_args()
+  results = []
+  template_slug = synth.load_template(args.template)['meta']['slug']
+  print("%10s %-15s %10s %14s %12s" % ('lines', 'phase', 'seconds', 'lines/sec', 'peak RSS MB'))
+  for line_count in args.sizes:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      config_file = None if args.skip_cli else os.path.join(tmp_dir, 'synthetic.cfg')
+      with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        result = executor.submit(bench_size, line_count, args, config_file).result()
+      if config_file:
+        # cli.py is run from this process rather than from bench_size, whose generated lines would count towards each run's peak RSS
+        cli_runs = [run_cli(template_slug, config_file) for _ in range(args.repeat)]
+        cli_seconds = min(run[0] for run in cli_runs)
+        result['phases']['cli'] = {'seconds': cli_seconds, 'lines_per_sec': result['lines'] / cli_seconds}
+        result['cli_peak_rss_bytes'] = max(run[1] for run in cli_runs)
+    results.append(result)
+    if result['found_orphans'] != result['expected_orphans']:
+      print("WARNING: %s lines: expected %s orphans, found %s" % (result['lines'], result['expected_orphans'], result['found_orphans']))
+    for phase in PHASES:
+      if phase not in result['phases']:
+        continue
+      timing = result['phases'][phase]
+      rss = result['cli_peak_rss_bytes'] if phase == 'cli' else result['peak_rss_bytes']
+      print("%10s %-15s %10.4f %14s %12.1f" % (result['lines'], phase, timing['seconds'], '%.0f' % timing['lines_per_sec'] if timing['lines_per_sec'] else '-', rss / 1048576))
+  if args.json:
+    with open(args.json, 'w') as f:
+      json.dump({
+        'meta': {
+          'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+          'python': platform.python_version(),
+          'platform': platform.platform(),
+          'args': vars(args),
+        },
+        'results': results,
+      }, f, indent=2)
+  if args.compare and compare(results, args.compare, args.threshold):
+    sys.exit(1)
+
+if __name__ == '__main__':
+  main()
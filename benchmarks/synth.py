@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+'''Generate synthetic device configurations from the object definitions of a template, for benchmarking'''
+import argparse
+import os
+import random
+import re
+import sys
+import yaml
+
+# regex fragments replaced by example text when turning a template regex into a line which matches it
+_EXAMPLE_FRAGMENTS = [
+  (re.compile(r'\(\?P<name>[^)]*\)'), '{name}'),
+  (re.compile(r'\[[^\]]*\][+*]'), 'x1'),
+  (re.compile(r'\.\*'), 'x1'),
+  (re.compile(r'\\s[+*]'), ' '),
+  (re.compile(r'\\(.)'), r'\1'),
+]
+
+def example_line(regex):
+  '''Turn a template regex into a format string with a {name} field whose result matches the regex, or return None when the regex
+  uses constructs which cannot be turned into example text'''
+  anchored = regex.startswith('^')
+  example = regex[1:] if anchored else regex
+  for fragment, replacement in _EXAMPLE_FRAGMENTS:
+    example = fragment.sub(replacement, example)
+  if re.search(r'[\\^$()[\]{}*+?|]', example.replace('{name}', '')):
+    return None
+  match = re.search(regex, example.format(name='probe-name'))
+  if not match or match.group('name') != 'probe-name':
+    return None
+  return example
+
+def load_template(template_file):
+  with open(template_file) as f:
+    return yaml.safe_load(f)
+
+def generate(template, line_count, object_count, reference_density=1.0, orphan_ratio=0.1, seed=0):
+  '''Return (lines, orphans) for a configuration of roughly line_count lines defining object_count objects of the template's object
+  types.  Objects which are not orphans are referenced reference_density times on average, at least once.  orphans is a dict of
+  object slugs to the set of names generated without any reference'''
+  rng = random.Random(seed)
+  object_types = []
+  for obj_def in template['objects']:
+    definition = example_line(obj_def['regex'])
+    # (example line, whether the regex is anchored to the start of a line) of each reference which can be generated
+    references = []
+    for reference_def in obj_def.get('references') or []:
+      example = example_line(reference_def['regex'])
+      if example:
+        references.append((example, reference_def['regex'].startswith('^')))
+    if definition and references:
+      object_types.append((obj_def['slug'], definition, references))
+  if not object_types:
+    raise ValueError("template has no object definitions which can be generated")
+  definitions = []
+  # top-level reference lines, and references which are placed inside sections
+  top_references = []
+  nested_references = []
+  orphans = {slug: set() for slug, definition, references in object_types}
+  for object_number in range(object_count):
+    slug, definition, references = object_types[object_number % len(object_types)]
+    name = '%s-%s' % (re.sub(r'[^A-Za-z0-9]+', '-', slug).upper(), object_number)
+    definitions.append(definition.format(name=name))
+    definitions.append('  remark generated object %s' % object_number)
+    if rng.random() < orphan_ratio:
+      orphans[slug].add(name)
+      continue
+    reference_count = max(1, int(reference_density) + (1 if rng.random() < reference_density % 1 else 0))
+    for _ in range(reference_count):
+      reference, anchored = rng.choice(references)
+      if anchored:
+        top_references.append(reference.format(name=name))
+      else:
+        nested_references.append(reference.format(name=name).strip())
+  lines = definitions + top_references
+  # nested references and filler are spread over interface sections until the requested size is reached
+  section_number = 0
+  rng.shuffle(nested_references)
+  while nested_references or len(lines) < line_count:
+    lines.append('interface Ethernet1/%s' % section_number)
+    lines.append('  description generated section %s' % section_number)
+    for _ in range(4):
+      if nested_references:
+        lines.append('  ' + nested_references.pop())
+    lines.append('  no shutdown')
+    section_number += 1
+  return lines, orphans
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--template', default=os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'templates', 'nxos.yaml'), help="Template whose object definitions are generated.  Default: templates/nxos.yaml")
+  parser.add_argument('--lines', type=int, default=10000, help="Approximate number of lines to generate")
+  parser.add_argument('--objects', type=int, default=None, help="Number of objects to define.  Default: 5%% of lines")
+  parser.add_argument('--reference-density', type=float, default=1.0, help="Average number of references to each referenced object")
+  parser.add_argument('--orphan-ratio', type=float, default=0.1, help="Fraction of objects generated without references")
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args()
+  lines, orphans = generate(load_template(args.template), args.lines, args.objects if args.objects is not None else args.lines // 20, args.reference_density, args.orphan_ratio, args.seed)
+  sys.stdout.writelines(line + '\n' for line in lines)
+  sys.stderr.write("Generated %s lines with %s orphans\n" % (len(lines), sum(len(names) for names in orphans.values())))
+
+if __name__ == '__main__':
+  main()
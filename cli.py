@@ -1,11 +1,16 @@
 #! /usr/bin/env python3
 '''orphanreaper - locate orphaned configuration elements in text-based network device configurations, generate configlets for removal'''
 import argparse
-import glob
+import contextlib
 import logging
 import os
+import re
 import sys
+from orphanreaper import config
+from orphanreaper import inputs
+from orphanreaper import output
 from orphanreaper import reaper
+from orphanreaper import watch
 
 
 
@@ -26,7 +31,8 @@ class OrphanReaper():
     # will be created after args are parsed and init() is called
     self.reaper = None
   def validate_and_open_files(self):
-    '''Convert directories to lists of files, sanity-check files for existence, length, etc.  Operates on self.filenames, and populates self.files'''
+    '''Convert directories to lists of files, sanity-check files for existence, length, etc.  Operates on self.filenames, and populates self.files.
+    Files are not read here; the reaper reads each one when its turn comes'''
 
     # first loop through looking for any templates that are expected to read content from stdin "-"
     # This must be done first to avoid treating "-" as an invalid filename in later tests
@@ -51,7 +57,7 @@ class OrphanReaper():
       for filename in filenames:
         if os.path.isdir(filename):
           self.logger.debug("Found directory %s", filename)
-          files_in_dir = glob.glob(filename + os.sep + '*')
+          files_in_dir = inputs.expand_directory(filename)
           self.logger.info("Adding %s files from directory %s to list for template %s", len(files_in_dir), filename, template_name)
           self.logger.debug("Will be adding new files: %s", files_in_dir)
           add_files_to_template.update(set(files_in_dir))
@@ -61,9 +67,10 @@ class OrphanReaper():
       filenames.difference_update(remove_files_from_template)
       filenames.update(add_files_to_template)
       self.logger.debug("File list for template %s now contains: %s", template_name, self.filenames[template_name])          
-    for template_name, filenames in self.filenames.items():
+    # files are added in sorted order, so that results, logs and output are in the same order on every run
+    for template_name, filenames in sorted(self.filenames.items()):
       remove_files_from_template = set()
-      for filename in filenames:
+      for filename in sorted(filenames):
         if os.path.isfile(filename):
           # this is a file.  Test that it is not empty
           if not os.path.getsize(filename):
@@ -87,13 +94,26 @@ class OrphanReaper():
           else:
             self.logger.error("Exiting due to missing or invalid file found during validation of input: %s", filename)
             sys.exit()
-        with open(filename) as f:
-          lines = [line.strip('\r\n') for line in f.readlines()]
-        self.files.append({'filename':filename, 'lines':lines, 'template':template_name})
+        if inputs.is_archive(filename):
+          # each member of an archive is an input file of its own, read from the archive when the reaper analyzes it
+          try:
+            members = inputs.archive_records(filename, template_name)
+          except inputs.READ_ERRORS as exc:
+            if self.args.skip_missing:
+              self.logger.warning("Skipping unreadable archive %s: %s", filename, exc)
+              remove_files_from_template.add(filename)
+              continue
+            self.logger.error("Exiting due to unreadable archive found during validation of input: %s: %s", filename, exc)
+            sys.exit()
+          self.logger.info("Adding %s files from archive %s to list for template %s", len(members), filename, template_name)
+          self.files.extend(members)
+          continue
+        # the file is only read when the reaper analyzes it, so that one file at a time is held in memory
+        self.files.append({'filename':filename, 'template':template_name})
       self.logger.debug("Iteration of files for template %s complete, now removing %s entries that were found to be empty or missing", template_name, len(remove_files_from_template))
       self.filenames[template_name].difference_update(remove_files_from_template)
       self.logger.debug("File list for template %s now contains: %s", template_name, self.filenames[template_name])
-      return len(self.files)
+    return len(self.files)
   def run(self):
     '''Run the CLI behavior'''
 
@@ -104,19 +124,47 @@ class OrphanReaper():
     parser.add_argument('--config', default=os.path.dirname(os.path.realpath(__file__)) + os.sep + "conf" + os.sep + "reaper.cfg.yaml",help="Configuration file location.  Default: reaper.cfg.yaml")
     parser.add_argument('--defaults', action='store_true' ,help="Use packag defaults for all configuration")
     parser.add_argument('--defaultconfig', default=os.path.dirname(os.path.realpath(__file__)) + os.sep + "conf" + os.sep + "reaper.cfg.defaults.yaml",help="Configuration defaults file location.  Default: reaper.cfg.defaults.yaml.  Normal users should never change this.")
+    parser.add_argument('--trace', action="store_true", help="Log every object definition and reference matched, with its line.  Implies -d")
     parser.add_argument('--skip-missing', action="store_true", help="Treat missing and other bad files as warnings instead of errors")
     parser.add_argument('--skip-empty', action="store_true", help="Treat empty files as warnings instead of errors")
-    parser.add_argument('deviceconfigs', nargs='+', help="Device config filename and the template to use for parsing.  Specify directory names instead of file names, for all files in that directory to be included with the specified template.")
+    parser.add_argument('--transitive', action="store_true", help="Also report objects which are only referenced from within orphaned objects, such as the prefix-lists of an orphaned route-map")
+    parser.add_argument('--group-pattern', default=None, help="Regex matched against each input filename.  Files of the same template with the same match (or the same `group` named group) share objects and references, e.g. a base config split from its routing-policy include")
+    parser.add_argument('--cleanup', action="store_true", help="Print removal configlets for the orphans found to stdout")
+    parser.add_argument('--cleanup-dir', default=None, help="Write removal configlets for the orphans found to one file per device in this directory")
+    parser.add_argument('--output', choices=output.FORMATS, default=None, help="Write one record per orphan, with the line number and parent sections of its definition, as newline-delimited JSON or as a JSON array.  Records are written as each file finishes")
+    parser.add_argument('--output-file', default=None, help="With --output, write the records to this file instead of stdout")
+    parser.add_argument('--profile', action="store_true", help="Print a report of time spent per phase, per file and per template regex to stderr")
+    parser.add_argument('--profile-json', default=None, help="Write profiling data as JSON to this file.  Implies --profile without the printed report")
+    parser.add_argument('--watch', type=float, default=None, metavar='SECONDS', help="Keep running, polling the input files and directories every SECONDS and re-analyzing only files which were added or modified")
+    parser.add_argument('--inventory', default=None, help="With --watch, atomically rewrite this file with the JSON orphan inventory after every change")
+    parser.add_argument('--socket', default=None, help="With --watch, serve the JSON orphan inventory to each client connecting to this Unix socket")
+    parser.add_argument('--no-cache', action="store_true", help="Analyze every file even if its results are in the result cache, and do not update the cache")
+    parser.add_argument('--cache-dir', default=None, help="Result cache directory.  Default: the cache dir from the configuration")
+    parser.add_argument('--no-template-cache', action="store_true", help="Load templates from their files, without reading or writing the compiled template artifact in the cache directory")
+    parser.add_argument('-j','--jobs', type=int, default=1, help="Number of worker processes used to analyze files in parallel.  0 uses one per CPU.  Default: 1")
+    parser.add_argument('deviceconfigs', nargs='+', help="Device config filename and the template to use for parsing.  Specify directory names instead of file names, for all files below that directory to be included with the specified template.  Files ending in .gz, .bz2 or .xz are decompressed while they are read, and each member of a tar or zip archive is an input file of its own.")
     self.args = parser.parse_args()
     # set verbosity in logger
     if self.args.quiet:
       self.logger.setLevel(logging.WARN)
       self.logger.debug("args.quiet specified  - setting log level to logging.WARN")
-    if self.args.debug:
+    if self.args.debug or self.args.trace:
       self.logger.setLevel(logging.DEBUG)
       self.logger.debug("args.debug specified  - setting log level to logging.DEBUG")
     if self.args.defaults:
         self.args.config = None
+    if self.args.group_pattern:
+      try:
+        re.compile(self.args.group_pattern)
+      except re.error as exc:
+        self.logger.error("Exiting due to invalid --group-pattern `%s`: %s", self.args.group_pattern, exc)
+        sys.exit()
+    if self.args.cleanup_dir and not os.path.isdir(self.args.cleanup_dir):
+      self.logger.error("Exiting -- cleanup directory %s does not exist", self.args.cleanup_dir)
+      sys.exit()
+    if self.args.output and self.args.cleanup and not self.args.output_file:
+      self.logger.error("Exiting -- --output and --cleanup cannot both write to stdout, use --output-file or --cleanup-dir")
+      sys.exit()
     # load device configs with specified syntax
     # dictionary of template name to set of files
     # intentionally using a set to dedupe
@@ -127,22 +175,57 @@ class OrphanReaper():
         self.filenames[template_name] = set()
       self.filenames[template_name].add(filename)
 
+    if self.args.watch is not None:
+      self.watch()
+      return
     # validate that files exist, have at least 2 lines, etc
-    files_opened = self.validate_and_open_files()
-    self.logger.info("Successfully opened %s files", files_opened)
+    files_validated = self.validate_and_open_files()
+    self.logger.info("Successfully validated %s files", files_validated)
     # create reaper object, etc
     self.init()
-    # identify orphans
-    orphans = self.reaper.find_orphans()
+    # identify orphans, streaming them in the style specified if requested
+    if self.args.output:
+      with open(self.args.output_file, 'w') if self.args.output_file else contextlib.nullcontext(sys.stdout) as f:
+        with output.OrphanWriter(f, self.args.output) as writer:
+          orphans = self.reaper.find_orphans(writer=writer)
+    else:
+      orphans = self.reaper.find_orphans()
     if orphans is None:
       self.logger.error("Application run aborted due to prior errors, see above.")
       sys.exit()
-    # print the orphans, if requested and in the style specified
 
     # print the remediation script, if requested and in the style specified
-    reaped = self.reaper.reap_orphans(orphans)
+    if self.args.cleanup or self.args.cleanup_dir:
+      if self.reaper.reap_orphans(output_dir=self.args.cleanup_dir) is None:
+        self.logger.error("Application run aborted due to prior errors, see above.")
+        sys.exit()
+    # print or save profiling data, if requested
+    if self.args.profile:
+      sys.stderr.write(self.reaper.profiler.report() + '\n')
+    if self.args.profile_json:
+      with open(self.args.profile_json, 'w') as f:
+        self.reaper.profiler.dump(f)
+  def watch(self):
+    '''Run in watch mode: files and directories are polled rather than validated once, and missing or empty files are ignored until
+    they have content'''
+    if any('-' in filenames for filenames in self.filenames.values()):
+      self.logger.error("Exiting -- stdin \"-\" cannot be used with --watch")
+      sys.exit()
+    if not self.args.inventory and not self.args.socket:
+      self.logger.error("Exiting -- --watch requires --inventory and/or --socket to publish the orphan inventory")
+      sys.exit()
+    self.init()
+    watched = [(template_name, os.path.abspath(filename)) for template_name, filenames in self.filenames.items() for filename in sorted(filenames)]
+    watcher = watch.Watcher(self.reaper, watched, interval=self.args.watch, inventory_file=self.args.inventory, socket_path=self.args.socket, logger=self.logger)
+    if not watcher.run():
+      self.logger.error("Application run aborted due to prior errors, see above.")
+      sys.exit()
   def init(self):
-      self.reaper = reaper.Reaper(ucf=self.args.config, dcf=self.args.defaultconfig, files=self.files, logger=self.logger)
+    try:
+      self.reaper = reaper.Reaper(ucf=self.args.config, dcf=self.args.defaultconfig, files=self.files, logger=self.logger, jobs=self.args.jobs, use_cache=not self.args.no_cache, cache_dir=self.args.cache_dir, template_artifact=not self.args.no_template_cache, transitive=self.args.transitive, group_pattern=self.args.group_pattern, reap=bool(self.args.cleanup or self.args.cleanup_dir), lineage=bool(self.args.output), profile=bool(self.args.profile or self.args.profile_json), trace=self.args.trace)
+    except config.ConfigError:
+      # the reason has been logged by the configuration loader
+      sys.exit(1)
 
 if __name__ == '__main__':
   oreaper = OrphanReaper()
@@ -0,0 +1,109 @@
+'''On-disk cache of per-file analysis results, keyed by file content and the template used to analyze it'''
+import hashlib
+import json
+import logging
+import os
+from . import inputs
+
+# bump when the format of stored results changes, so that entries written by older versions are never read back
+CACHE_FORMAT = 3
+
+class ResultCache():
+  '''Content-addressed store of per-file analysis results.  Entries live in cache_dir as one JSON file each, and the least recently used
+  entries are evicted by evict() once the cache grows beyond max_bytes'''
+  def __init__(self, cache_dir, max_bytes, logger=None):
+    self.logger = logger if logger else logging.getLogger()
+    self.cache_dir = os.path.expanduser(cache_dir)
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    # set to False after a failed write, so that a read-only or full cache directory is reported once rather than once per file
+    self.writable = True
+    # entries stored since the last evict(), which only scans the cache directory when this run has made it grow
+    self.puts = 0
+  @staticmethod
+  def key(content_digest, template_fingerprint, mode=''):
+    '''Combine the digest of a file's content with the fingerprint of the template used to analyze it, and the analysis mode'''
+    return hashlib.sha256(('%s:%s:%s:%s' % (CACHE_FORMAT, template_fingerprint, mode, content_digest)).encode()).hexdigest()
+  def _path(self, key):
+    # shard entries over subdirectories to keep directory sizes manageable for large fleets
+    return os.path.join(self.cache_dir, key[:2], key + '.json')
+  def get(self, key):
+    '''Return the JSON data stored for key, or None when there is no usable entry'''
+    path = self._path(key)
+    try:
+      with open(path) as f:
+        stored = json.load(f)
+    except FileNotFoundError:
+      self.misses += 1
+      return None
+    except (OSError, ValueError) as exc:
+      self.logger.warning("Discarding unreadable cache entry %s: %s", path, exc)
+      self._remove(path)
+      self.misses += 1
+      return None
+    # refresh the modification time so that eviction treats this entry as recently used
+    try:
+      os.utime(path)
+    except OSError:
+      pass
+    self.hits += 1
+    return stored
+  def put(self, key, data):
+    '''Store JSON-serializable data for key'''
+    if not self.writable:
+      return
+    path = self._path(key)
+    try:
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with inputs.atomic_write(path) as f:
+        json.dump(data, f)
+      self.puts += 1
+    except OSError as exc:
+      self.logger.warning("Failed to write to result cache %s, caching is disabled for the rest of this run: %s", self.cache_dir, exc)
+      self.writable = False
+  def evict(self):
+    '''Remove least recently used entries until the cache is no larger than max_bytes.  Does nothing unless entries were stored since
+    the last call, as only stores make the cache grow.  Returns the number of entries removed'''
+    if not self.puts:
+      return 0
+    self.puts = 0
+    entries = []
+    total_bytes = 0
+    if not os.path.isdir(self.cache_dir):
+      return 0
+    for shard in os.scandir(self.cache_dir):
+      if not shard.is_dir():
+        continue
+      for entry in os.scandir(shard.path):
+        try:
+          stat = entry.stat()
+        except OSError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_bytes += stat.st_size
+    removed = 0
+    if total_bytes <= self.max_bytes:
+      return removed
+    entries.sort()
+    for mtime, size, path in entries:
+      if total_bytes <= self.max_bytes:
+        break
+      self._remove(path)
+      total_bytes -= size
+      removed += 1
+    self.logger.debug("Evicted %s entries from result cache %s", removed, self.cache_dir)
+    return removed
+  def _remove(self, path):
+    try:
+      os.remove(path)
+    except OSError:
+      pass
+
+def digest_lines(lines, batch_lines=4096):
+  '''Return the sha256 hex digest of in-memory file lines, each followed by a newline.  Lines are joined in batches to keep the number
+  of hash updates low'''
+  digest = hashlib.sha256()
+  for start in range(0, len(lines), batch_lines):
+    digest.update(('\n'.join(lines[start:start + batch_lines]) + '\n').encode())
+  return digest.hexdigest()
@@ -1,11 +1,18 @@
 import glob
 import logging
-import sys
+import os
 import yaml
 
+# directory containing orphanreaper.py, which relative paths in the configuration such as template path_globs are relative to
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DEFAULT_CONFIG = os.path.join(ROOT_DIR, 'conf', 'reaper.cfg.defaults.yaml')
+
+class ConfigError(Exception):
+  '''Raised when a configuration file, or the templates it references, cannot be loaded.  The reason has already been logged'''
+
 class Config():
   '''Class for loading Orphan Reaper's own configuration'''
-  def __init__(self, ucf, dcf, logger=None):
+  def __init__(self, ucf, dcf=DEFAULT_CONFIG, logger=None):
     self.logger = logger if logger else logging.getLogger()
     self.ucf = ucf
     self.dcf = dcf
@@ -19,8 +26,8 @@ class Config():
         with open(self.dcf) as yf:
             self.cfg = yaml.safe_load(yf.read())
     except Exception as e:
-        sys.stderr.write("Failed to load configuration defaults from file %s\n%s\n" % (self.dcf,str(e)))
-        sys.exit(1)
+        self.logger.error("Failed to load configuration defaults from file %s\n%s", self.dcf, e)
+        raise ConfigError(self.dcf) from e
   def _load_config(self):
     # If no user config file is specified, return the defaults.
     if self.ucf is None:
@@ -31,13 +38,12 @@ class Config():
         with open(self.ucf) as yf:
             userCfg = yaml.safe_load(yf.read())
     except FileNotFoundError as e:
-        sys.stderr.write("Failed to open configuration file %s\n%s\n" % (self.ucf,str(e)))
-        sys.stderr.write("Copy reaper.cfg.example.yaml to reaper.cfg.yaml or\n")
-        sys.stderr.write("use --defaults to run without a configuration file, which will all default values (not recommended).\n")
-        sys.exit(1)
+        self.logger.error("Failed to open configuration file %s\n%s\nCopy reaper.cfg.example.yaml to reaper.cfg.yaml or\n"
+          "use --defaults to run without a configuration file, which will all default values (not recommended).", self.ucf, e)
+        raise ConfigError(self.ucf) from e
     except Exception as e:
-        sys.stderr.write("Failed to load configuration file %s\n%s\n" % (ucf,str(e)))
-        sys.exit(1)
+        self.logger.error("Failed to load configuration file %s\n%s", self.ucf, e)
+        raise ConfigError(self.ucf) from e
     if not userCfg:
       self.logger.warning("User config %s contains no data, only configuration defaults from %s will be used", self.ucf, self.dcf)
       return
@@ -52,6 +58,10 @@ class Config():
             self.cfg[section] = userCfg[section]
   def has_section(self, section_name):
     return section_name in self.cfg
+  def resolve_path(self, path):
+    '''Return a path from the configuration, made absolute relative to ROOT_DIR if it is relative, so that it does not depend on the
+    current working directory'''
+    return os.path.join(ROOT_DIR, os.path.expanduser(path))
   def get_section(self, section_name):
     if section_name in self.cfg:
       return self.cfg[section_name]
@@ -0,0 +1,50 @@
+'''Graph of which configuration objects reference which others, used to find objects which are only referenced by orphans'''
+
+class ReferenceGraph():
+  '''Object reference graph of one input file.  Nodes are (object slug, name) tuples.  edges maps each defined object to the objects
+  referenced from within its definition, and roots holds the objects referenced from configuration outside of any defined object'''
+  def __init__(self):
+    self.edges = {}
+    self.roots = set()
+  def add_reference(self, container, target):
+    '''Record a reference to target made from within container, or from outside of any object when container is None'''
+    if container is None:
+      self.roots.add(target)
+    elif container != target:
+      if container not in self.edges:
+        self.edges[container] = set()
+      self.edges[container].add(target)
+  def update(self, other):
+    '''Merge the edges and roots of another graph into this one'''
+    self.roots.update(other.roots)
+    for container, targets in other.edges.items():
+      if container not in self.edges:
+        self.edges[container] = set()
+      self.edges[container].update(targets)
+  def reachable(self):
+    '''Return the set of objects which are referenced, directly or through other referenced objects, from outside of any object'''
+    reachable = set(self.roots)
+    pending = list(reachable)
+    while pending:
+      for target in self.edges.get(pending.pop(), ()):
+        if target not in reachable:
+          reachable.add(target)
+          pending.append(target)
+    return reachable
+  def unreachable(self, objects):
+    '''Given a dict of object slugs to sets of defined names, return a dict of the same shape holding only the defined objects which
+    are not reachable'''
+    reachable = self.reachable()
+    return {slug: {name for name in names if (slug, name) not in reachable} for slug, names in objects.items()}
+  def to_dict(self):
+    '''Return a JSON-serializable representation, which from_dict() turns back into a graph'''
+    return {
+      'edges': [[list(container), sorted(list(target) for target in targets)] for container, targets in self.edges.items()],
+      'roots': sorted(list(root) for root in self.roots),
+    }
+  @classmethod
+  def from_dict(cls, data):
+    reference_graph = cls()
+    reference_graph.edges = {tuple(container): {tuple(target) for target in targets} for container, targets in data['edges']}
+    reference_graph.roots = {tuple(root) for root in data['roots']}
+    return reference_graph
@@ -0,0 +1,56 @@
+'''Index of the object names defined and referenced by one or more input files'''
+from . import graph
+
+class NameIndex():
+  '''Names of the objects defined and referenced by one input file, or by a group of files merged with update().  objects and
+  references are dicts of object slugs to sets of names.  graph is the ReferenceGraph between the objects, or None when the index
+  was built without one, in which case only direct orphans can be found.  lineage is a dict of object slugs to dicts of names to
+  (line number, parent path) of each definition, or None when the index was built without it'''
+  def __init__(self, objects=None, references=None, reference_graph=None, lineage=None):
+    self.objects = objects if objects is not None else {}
+    self.references = references if references is not None else {}
+    self.graph = reference_graph
+    self.lineage = lineage
+  @classmethod
+  def from_parsed(cls, parsed, with_graph=False, with_lineage=False):
+    '''Build the index of a templates.ParsedFile.  The reference graph and the lineage require the file's section hierarchy, so they
+    are only built when with_graph and with_lineage are True'''
+    return cls(parsed.objects, parsed.references, parsed.graph if with_graph else None, parsed.lineage() if with_lineage else None)
+  def update(self, other):
+    '''Merge another index into this one, in time proportional to the number of names in the other index'''
+    for slug, names in other.objects.items():
+      self.objects.setdefault(slug, set()).update(names)
+    for slug, names in other.references.items():
+      self.references.setdefault(slug, set()).update(names)
+    if other.graph is not None:
+      if self.graph is None:
+        self.graph = graph.ReferenceGraph()
+      self.graph.update(other.graph)
+    # lineage describes the lines of one file, so a merged index keeps only its own
+  def orphans(self, objects=None, transitive=False):
+    '''Return a dict of slugs to sets of names of the orphans among objects, which defaults to every object in this index.  Passing the
+    objects of one file finds that file's orphans among the references of a whole group.  When transitive is True, objects only
+    referenced from within orphans are orphans too'''
+    if objects is None:
+      objects = self.objects
+    if transitive:
+      if self.graph is None:
+        raise ValueError("transitive orphans requested from an index built without a reference graph")
+      return self.graph.unreachable(objects)
+    return {slug: {name for name in names if name not in self.references.get(slug, ())} for slug, names in objects.items()}
+  def to_dict(self):
+    '''Return a JSON-serializable representation, which from_dict() turns back into an index'''
+    return {
+      'objects': {slug: sorted(names) for slug, names in self.objects.items()},
+      'references': {slug: sorted(names) for slug, names in self.references.items()},
+      'graph': self.graph.to_dict() if self.graph is not None else None,
+      'lineage': self.lineage,
+    }
+  @classmethod
+  def from_dict(cls, data):
+    return cls(
+      {slug: set(names) for slug, names in data['objects'].items()},
+      {slug: set(names) for slug, names in data['references'].items()},
+      graph.ReferenceGraph.from_dict(data['graph']) if data['graph'] is not None else None,
+      {slug: {name: (line_number, parent_path) for name, (line_number, parent_path) in names.items()} for slug, names in data['lineage'].items()} if data.get('lineage') is not None else None,
+    )
@@ -0,0 +1,130 @@
+'''Helpers for finding and reading the input files named on the command line, including compressed files and the members of archives,
+which are read as streams without extracting them to disk, and for turning configurations held in memory into lines'''
+import bz2
+import contextlib
+import gzip
+import io
+import lzma
+import os
+import tarfile
+import threading
+import zipfile
+import zlib
+
+# suffixes of compressed files and archive members, decompressed while they are read.  Each opener accepts a path or an open binary file
+COMPRESSED_SUFFIXES = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+ZIP_SUFFIXES = ('.zip',)
+# errors raised when an input file, archive or archive member cannot be read, decompressed or decoded
+READ_ERRORS = (OSError, EOFError, UnicodeDecodeError, tarfile.TarError, zipfile.BadZipFile, lzma.LZMAError, zlib.error)
+
+@contextlib.contextmanager
+def atomic_write(path, mode='w'):
+  '''Context manager yielding a file opened on a temporary file next to path, which is renamed into place when the block completes so
+  that readers, including concurrent runs, never see a partial file.  The temporary file is removed if writing fails'''
+  # unique per process and thread, so that concurrent writers of the same path never share a temporary file
+  tmp_path = '%s.%s.%s.tmp' % (path, os.getpid(), threading.get_ident())
+  try:
+    with open(tmp_path, mode) as f:
+      yield f
+    os.replace(tmp_path, path)
+  except BaseException:
+    with contextlib.suppress(OSError):
+      os.remove(tmp_path)
+    raise
+
+def config_line(line, encoding='utf-8'):
+  '''Return one line of an in-memory configuration as str, decoding bytes and stripping the line ending'''
+  if isinstance(line, bytes):
+    line = line.decode(encoding)
+  return line.strip('\r\n')
+
+def config_lines(config_text, encoding='utf-8'):
+  '''Return the lines of an in-memory configuration given as str, bytes or an iterable of str or bytes lines, stripping line endings
+  like lines read from a file'''
+  if isinstance(config_text, bytes):
+    config_text = config_text.decode(encoding)
+  if isinstance(config_text, str):
+    lines = config_text.split('\n')
+    # a final line ending does not start another line
+    if lines and not lines[-1]:
+      lines.pop()
+    return [line.strip('\r') for line in lines]
+  return [config_line(line, encoding) for line in config_text]
+
+def expand_directory(dirname):
+  '''Return the paths of all files below a directory, recursively and in sorted order.  Hidden files and directories are skipped'''
+  paths = []
+  for root, dirnames, filenames in os.walk(dirname):
+    dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+    paths.extend(os.path.join(root, filename) for filename in sorted(filenames) if not filename.startswith('.'))
+  return paths
+
+def is_archive(filename):
+  '''True if the file is a tar or zip archive whose members are input files, judging by its name'''
+  return filename.lower().endswith(TAR_SUFFIXES + ZIP_SUFFIXES)
+
+def open_text(filename):
+  '''Open an input file for reading text, decompressing it on the fly if its name ends with one of COMPRESSED_SUFFIXES'''
+  opener = COMPRESSED_SUFFIXES.get(os.path.splitext(filename)[1].lower())
+  return opener(filename, 'rt') if opener else open(filename)
+
+def archive_records(filename, template):
+  '''Return an input file record for each non-empty regular member of an archive, in archive order.  Each is named by the archive
+  path joined with the member name and read through an ArchiveReader.  Tar members also record the offset of their header, which
+  identifies them without a lookup by name'''
+  if filename.lower().endswith(ZIP_SUFFIXES):
+    with zipfile.ZipFile(filename) as archive:
+      members = [(info.filename, None) for info in archive.infolist() if not info.is_dir() and info.file_size]
+  else:
+    # listing a compressed tarball decompresses it once, without writing anything to disk
+    with tarfile.open(filename, 'r:*') as archive:
+      members = [(info.name, info.offset) for info in archive if info.isfile() and info.size]
+  return [{'filename':os.path.join(filename, os.path.normpath(member)), 'archive':filename, 'member':member, 'member_offset':offset, 'template':template} for member, offset in members]
+
+class ArchiveReader():
+  '''Reads archive members as text lines, keeping the most recently used archive open.  Tar members are found by reading the headers
+  of the open archive forward from the last member read, never by name, which makes tarfile read every header to the end of the
+  archive.  Reading the members of a compressed tarball in archive order therefore decompresses it once, while going back to an
+  earlier member restarts decompression from the beginning'''
+  def __init__(self):
+    self.filename = None
+    self.archive = None
+    # TarInfo of every tar member whose header has been read so far, by header offset and by name
+    self.by_offset = {}
+    self.by_name = {}
+  def read_lines(self, filename, member, offset=None):
+    '''Return the lines of an archive member, stripping line endings and decompressing it if its name ends with one of
+    COMPRESSED_SUFFIXES.  offset is the header offset of a tar member as recorded by archive_records(), without it the first tar
+    member of that name is read'''
+    if filename != self.filename:
+      self.close()
+      self.archive = zipfile.ZipFile(filename) if filename.lower().endswith(ZIP_SUFFIXES) else tarfile.open(filename, 'r:*')
+      self.filename = filename
+    if isinstance(self.archive, zipfile.ZipFile):
+      try:
+        f = self.archive.open(member)
+      except KeyError:
+        raise zipfile.BadZipFile("member %s not found in archive %s" % (member, filename))
+    else:
+      f = self.archive.extractfile(self._tar_member(member, offset))
+    opener = COMPRESSED_SUFFIXES.get(os.path.splitext(member)[1].lower())
+    with f, io.TextIOWrapper(opener(f, 'rb') if opener else f) as text:
+      return [line.strip('\r\n') for line in text]
+  def _tar_member(self, member, offset):
+    '''Return the TarInfo of a member of the open tar archive, reading headers forward until it is found'''
+    headers, key = (self.by_offset, offset) if offset is not None else (self.by_name, member)
+    while key not in headers:
+      tarinfo = self.archive.next()
+      if tarinfo is None:
+        raise tarfile.TarError("member %s not found in archive %s" % (member, self.filename))
+      self.by_offset[tarinfo.offset] = tarinfo
+      self.by_name.setdefault(tarinfo.name, tarinfo)
+    return headers[key]
+  def close(self):
+    if self.archive:
+      self.archive.close()
+    self.filename = None
+    self.archive = None
+    self.by_offset = {}
+    self.by_name = {}
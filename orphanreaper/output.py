@@ -0,0 +1,49 @@
+'''Machine-readable output of orphans, streamed one file at a time so that a fleet's results never have to be held in memory'''
+import json
+
+FORMATS = ('ndjson', 'json')
+
+class OrphanWriter():
+  '''Writes one record per orphan to a file object as each input file finishes.  ndjson writes one JSON object per line; json writes
+  a single JSON array whose elements are written as they arrive.  Records hold the filename, template slug, object type, name, the
+  1-based line number of the object's definition and its parent path, the enclosing section lines outermost first'''
+  def __init__(self, f, output_format='ndjson'):
+    if output_format not in FORMATS:
+      raise ValueError("unknown output format `%s`, expected one of: %s" % (output_format, ', '.join(FORMATS)))
+    self.f = f
+    self.output_format = output_format
+    self.records = 0
+  def __enter__(self):
+    if self.output_format == 'json':
+      self.f.write('[')
+    return self
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+  def write_file(self, file, lineage=None):
+    '''Write the records of one file's orphans, from file['orphans'] and the lineage of its index.  Orphans without lineage get null
+    line and parent'''
+    lineage = lineage or {}
+    records = []
+    for slug, names in file['orphans'].items():
+      for name in sorted(names):
+        line_number, parent_path = lineage.get(slug, {}).get(name, (None, None))
+        records.append({
+          'file': file['filename'],
+          'template': file['template'],
+          'type': slug,
+          'name': name,
+          'line': line_number + 1 if line_number is not None else None,
+          'parent': parent_path,
+        })
+    if self.output_format == 'ndjson':
+      self.f.writelines(json.dumps(record) + '\n' for record in records)
+    else:
+      # array elements are separated by commas, so only the first element of the whole output is written without one
+      self.f.writelines((',\n' if self.records or position else '\n') + json.dumps(record) for position, record in enumerate(records))
+    self.records += len(records)
+    self.f.flush()
+  def close(self):
+    '''Finish the output.  Terminates the json array, and is a no-op for ndjson'''
+    if self.output_format == 'json':
+      self.f.write('\n]\n')
+      self.f.flush()
@@ -0,0 +1,72 @@
+'''Timing and counters collected when profiling is enabled, used to find which phase, file or template regex makes a run slow'''
+import contextlib
+import json
+import time
+
+class Profiler():
+  '''Accumulates time per phase, parse time per file, and match counts and time per template regex.  Code which collects into a
+  Profiler checks for one once per phase or file, so that runs without profiling pay nothing per line'''
+  def __init__(self):
+    # phase name to [seconds, calls]
+    self.phases = {}
+    # list of (filename, line count, seconds to parse)
+    self.files = []
+    # (template slug, kind, object slug, definition name, regex) to [lines tested, matches, seconds]
+    self.regexes = {}
+  @contextlib.contextmanager
+  def phase(self, name):
+    '''Context manager adding the time spent in its block to a phase'''
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.add_phase(name, time.perf_counter() - start)
+  def add_phase(self, name, seconds, calls=1):
+    if name not in self.phases:
+      self.phases[name] = [0.0, 0]
+    self.phases[name][0] += seconds
+    self.phases[name][1] += calls
+  def add_file(self, filename, line_count, seconds):
+    self.files.append((filename, line_count, seconds))
+  def regex_stats(self, key):
+    '''Return the mutable [lines tested, matches, seconds] counters of a regex, creating them if needed'''
+    if key not in self.regexes:
+      self.regexes[key] = [0, 0, 0.0]
+    return self.regexes[key]
+  def update(self, data):
+    '''Merge profiling data produced by to_dict(), e.g. by a worker process, into this profiler'''
+    for name, (seconds, calls) in data['phases'].items():
+      self.add_phase(name, seconds, calls)
+    self.files.extend(tuple(file) for file in data['files'])
+    for entry in data['regexes']:
+      stats = self.regex_stats(tuple(entry['key']))
+      stats[0] += entry['lines']
+      stats[1] += entry['matches']
+      stats[2] += entry['seconds']
+  def to_dict(self):
+    '''Return a JSON-serializable representation of the collected data'''
+    return {
+      'phases': {name: list(values) for name, values in self.phases.items()},
+      'files': [list(file) for file in self.files],
+      'regexes': [{'key': list(key), 'lines': stats[0], 'matches': stats[1], 'seconds': stats[2]} for key, stats in self.regexes.items()],
+    }
+  def dump(self, f):
+    '''Write the collected data to a file object as JSON, with regexes and files ranked slowest first'''
+    data = self.to_dict()
+    data['regexes'].sort(key=lambda entry: entry['seconds'], reverse=True)
+    data['files'].sort(key=lambda file: file[2], reverse=True)
+    json.dump(data, f, indent=2)
+  def report(self, top=20):
+    '''Return a ranked, human readable report of the collected data'''
+    lines = ['Phases:']
+    for name, (seconds, calls) in sorted(self.phases.items(), key=lambda item: item[1][0], reverse=True):
+      lines.append('  %10.4fs %8s calls  %s' % (seconds, calls, name))
+    lines.append('Template regexes, slowest first:')
+    lines.append('  %10s %10s %10s  %s' % ('seconds', 'lines', 'matches', 'template kind object `definition`: regex'))
+    for key, (tested, matches, seconds) in sorted(self.regexes.items(), key=lambda item: item[1][2], reverse=True)[:top]:
+      template_slug, kind, obj_slug, definition_name, regex = key
+      lines.append('  %10.4f %10s %10s  %s %s %s `%s`: %s' % (seconds, tested, matches, template_slug, kind, obj_slug, definition_name, regex))
+    lines.append('Files, slowest parse first:')
+    for filename, line_count, seconds in sorted(self.files, key=lambda file: file[2], reverse=True)[:top]:
+      lines.append('  %10.4fs %10s lines  %s' % (seconds, line_count, filename))
+    return '\n'.join(lines)
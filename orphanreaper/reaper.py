@@ -1,43 +1,570 @@
 '''Main business logic module for identifying orphans and proposing configuration changes'''
+import contextlib
 import logging
+import os
+import re
+import sys
+from . import cache
 from . import config
+from . import index
+from . import inputs
+from . import profiling
 from . import templates
+
+# Templates instance and result cache of a worker process started by Reaper.find_orphans when jobs > 1, created once per process by
+# _init_worker.  _worker_cache is None when the result cache is disabled
+_worker_templates = None
+_worker_cache = None
+
+def read_lines(fd):
+  '''Read all lines from an open file, stripping line endings'''
+  return [line.strip('\r\n') for line in fd.readlines()]
+
+def _cache_key(loaded_templates, file, mode):
+  '''Return the result cache key of a file whose lines are loaded, from the digest of its lines, the fingerprint of its template and
+  the analysis mode'''
+  return cache.ResultCache.key(cache.digest_lines(file['lines']), loaded_templates.get_compiled(file['template']).fingerprint, mode)
+
+def _init_worker(ucf, dcf, artifact_dir, trace, cache_dir, cache_max_bytes):
+  '''Process pool initializer: load configuration and templates, and open the result cache if cache_dir is set, once in each worker
+  process'''
+  global _worker_templates, _worker_cache
+  worker_config = config.Config(ucf, dcf)
+  worker_config.load()
+  _worker_templates = templates.Templates(worker_config, artifact_dir=artifact_dir)
+  _worker_templates.trace = trace
+  if not _worker_templates.load():
+    raise RuntimeError("Worker process failed to load templates, see above")
+  _worker_cache = cache.ResultCache(cache_dir, cache_max_bytes) if cache_dir else None
+
+def _index_worker_lines(file, cache_mode, with_graph, with_lineage):
+  '''Return (index.NameIndex, True if it was found in the result cache) of a file record whose lines are loaded in a worker process,
+  storing a newly computed index in the cache'''
+  if _worker_cache:
+    file['cache_key'] = _cache_key(_worker_templates, file, cache_mode)
+    stored = _worker_cache.get(file['cache_key'])
+    if stored is not None:
+      return index.NameIndex.from_dict(stored), True
+  file_index = _worker_templates.get_index(file, with_graph=with_graph, with_lineage=with_lineage)
+  if _worker_cache and file_index is not None:
+    _worker_cache.put(file['cache_key'], file_index.to_dict())
+  return file_index, False
+
+def _index_worker(template_slug, filename, cache_mode, with_graph, with_lineage, profile):
+  '''Process pool task: read one input file by path and return (index.NameIndex, profiling data of this task when profile is True
+  else None, True if the index was found in the result cache).  Reading, digesting and the cache lookup all happen here, so that
+  the parent process never reads files handed to workers'''
+  _worker_templates.profiler = profiling.Profiler() if profile else None
+  file = {'filename':filename, 'template':template_slug}
+  try:
+    with inputs.open_text(filename) as f:
+      file['lines'] = read_lines(f)
+  except inputs.READ_ERRORS as exc:
+    _worker_templates.logger.error("Failed to read input file %s: %s", filename, exc)
+    return None, None, False
+  file_index, cached = _index_worker_lines(file, cache_mode, with_graph, with_lineage)
+  return file_index, _worker_templates.profiler.to_dict() if profile else None, cached
+
+def _index_archive_worker(archive_filename, members, cache_mode, with_graph, with_lineage, profile):
+  '''Process pool task: read a run of members of one archive in archive order, given as (template slug, member name, member offset,
+  filename) tuples, and return a list of the same results as _index_worker for each.  The list ends early at a member which could not
+  be read'''
+  reader = inputs.ArchiveReader()
+  results = []
+  try:
+    for template_slug, member, member_offset, filename in members:
+      _worker_templates.profiler = profiling.Profiler() if profile else None
+      file = {'filename':filename, 'template':template_slug}
+      try:
+        file['lines'] = reader.read_lines(archive_filename, member, member_offset)
+      except inputs.READ_ERRORS as exc:
+        _worker_templates.logger.error("Failed to read input file %s: %s", filename, exc)
+        results.append((None, None, False))
+        break
+      file_index, cached = _index_worker_lines(file, cache_mode, with_graph, with_lineage)
+      results.append((file_index, _worker_templates.profiler.to_dict() if profile else None, cached))
+  finally:
+    reader.close()
+  return results
+
 class Reaper():
   '''Main logic class for Orphan Reaper: load configurations, parse objects, identify references, generate cleanup configuration scripts'''
-  def __init__(self, ucf, dcf, files=None,logger=None):
+  def __init__(self, ucf=None, dcf=config.DEFAULT_CONFIG, files=None,logger=None, jobs=1, use_cache=True, cache_dir=None, template_artifact=True, transitive=False, group_pattern=None, reap=False, lineage=False, profile=False, trace=False):
     self.logger = logger if logger else logging.getLogger()
+    self.ucf = ucf
+    self.dcf = dcf
     self.config = config.Config(ucf, dcf)
     self.config.load()
-    self.templates = templates.Templates(self.config)
-    self.templates.load()
-    self.files = files # list of dicts describing files
+    # directory of the result cache and the compiled template artifact
+    self.cache_dir = cache_dir if cache_dir else (self.config.get_section('cache') or {}).get('dir')
+    self.cache = self._init_cache(use_cache)
+    # the compiled template artifact only speeds up startup, so it is used even when cached analysis results are not.  With
+    # template_artifact=False templates are always loaded from their files and nothing is written to the cache dir for them
+    self.templates = templates.Templates(self.config, artifact_dir=self.cache_dir if template_artifact else None)
+    if not self.templates.load():
+      self.logger.error("Failed to load templates, see above")
+      raise config.ConfigError('templates')
+    self.files = files if files is not None else [] # list of dicts describing files
+    # archive members are read through this reader, which keeps the current archive open while its members are analyzed in order
+    self.archives = inputs.ArchiveReader()
+    # number of worker processes used by find_orphans.  1 analyzes files serially in this process, 0 uses one worker per CPU
+    self.jobs = jobs if jobs else os.cpu_count()
+    # process pool kept open by open_pool() across index_files() calls, such as the polls of watch mode, so that its workers load the
+    # configuration and templates once.  When None, each parallel index_files() call starts and stops a pool of its own
+    self.pool = None
+    # when True, objects only referenced from within orphaned objects are reported as orphans too
+    self.transitive = transitive
+    # True when the caller will use reap_orphans, which needs every file's orphans after find_orphans returns
+    self.reap = reap
+    # reference graphs are only needed to find transitive orphans.  Without them no orphan references another orphan, since that
+    # reference would keep it from being an orphan, so removal configlets need no graph to be ordered either
+    self.with_graph = transitive
+    # the line number and parent path of each definition, needed by machine-readable output, also require the section hierarchy
+    self.with_lineage = lineage
+    # indexes with a reference graph or lineage are cached separately, as building them requires the section hierarchy
+    self.cache_mode = ('graph' if self.with_graph else 'names') + ('+lineage' if self.with_lineage else '')
+    # files whose names produce the same match of this regex (its `group` group if it has one) share one index of objects and
+    # references, so that an object defined in one file and referenced in another is not an orphan.  None analyzes files in isolation
+    self.group_pattern = re.compile(group_pattern) if group_pattern else None
+    # collects per-phase, per-file and per-regex timings when profiling, shared with the templates.  None when profiling is off
+    self.profiler = profiling.Profiler() if profile else None
+    self.templates.profiler = self.profiler
+    # per-line tracing of every definition and reference matched while parsing
+    self.templates.trace = trace
 
-  def open_files(self):
-    '''Loop through self.files and open each file that is not yet opened'''
-    for file in self.files:
-      if 'contents' not in file:
-        with open(file) as f:
-          file['contents'] = f.read()
+  def _phase(self, name):
+    '''Context manager timing a phase of the run into the profiler, which does nothing when profiling is off'''
+    return self.profiler.phase(name) if self.profiler else contextlib.nullcontext()
+  def _init_cache(self, use_cache):
+    '''Create the result cache described by the cache section of the configuration, or return None if caching is disabled'''
+    cache_config = self.config.get_section('cache') or {}
+    if not use_cache or not cache_config.get('enabled', False):
+      self.logger.debug("Result cache is disabled")
+      return None
+    if not self.cache_dir:
+      self.logger.warning("Result cache is enabled but no cache dir is configured, continuing without a cache")
+      return None
+    return cache.ResultCache(self.cache_dir, int(cache_config.get('max_size_mb', 256)) * 1024 * 1024, logger=self.logger)
+
+  def open_file(self, file):
+    '''Read a file's lines into file['lines'] if they are not loaded yet, from its fd (such as stdin), from its archive if it is an
+    archive member, or else from its filename, decompressing it if needed.  Returns True if the lines were read by this call, False if
+    they were already loaded'''
+    if 'lines' in file:
+      return False
+    if 'fd' in file:
+      file['lines'] = read_lines(file['fd'])
+    elif 'member' in file:
+      file['lines'] = self.archives.read_lines(file['archive'], file['member'], file.get('member_offset'))
+    else:
+      with inputs.open_text(file['filename']) as f:
+        file['lines'] = read_lines(f)
+    return True
+  def close_file(self, file):
+    '''Release a file's lines and parse once its results are computed'''
+    file.pop('parsed', None)
+    file.pop('lines', None)
   def preflight(self):
     '''Sanity checks prior to looking for orphaned configuration'''
     # check that all files have templates which exist in the configuration
     templates_used_by_files = set([file['template'] for file in self.files])
     self.logger.debug("Templates referenced by user input: %s", templates_used_by_files)
-    templates_in_configuration = set(self.templates.index.keys())
+    templates_in_configuration = set(self.templates.compiled.keys())
     self.logger.debug("Templates loaded from configuration: %s", templates_in_configuration)
     if not templates_used_by_files <= templates_in_configuration:
       self.logger.error("The following templates referenced for input files are not present in the configuration: %s", templates_used_by_files-templates_in_configuration)
       return False
 
     return True
-  def find_orphans(self):
+  def find_orphans(self, writer=None):
+    '''Find the orphans of every file, log them and write them to writer, an output.OrphanWriter, if one is given.  Returns the number
+    of orphans found, or None on error.  Each file's orphans are left in file['orphans'], except when streaming to a writer with files
+    analyzed in isolation and the Reaper not created with reap=True: then each file is reported as soon as it is indexed and its
+    results are released, so that a fleet's results are never held in memory at once'''
     if not self.preflight():
       return None
-    orphan_count = 0
-    for file in self.files:
-      
-      file['orphans'] = self.templates.get_orphans(file)
-      orphan_count += len(file['orphans'])
+    if writer and not self.group_pattern and not self.reap:
+      orphan_counts = []
+      if not self.index_files(self.files, on_indexed=lambda file: orphan_counts.append(self._report_file(file, writer, release=True))):
+        return None
+      return sum(orphan_counts)
+    if not self.index_files(self.files):
+      return None
+    with self._phase('resolve orphans'):
+      self.resolve_orphans()
+    return sum(self._report_file(file, writer) for file in self.files)
+  def _report_file(self, file, writer=None, release=False):
+    '''Resolve the orphans of a file indexed in isolation unless they are already resolved, then log them and write them to writer.
+    With release, the file's index and orphans are dropped afterwards.  Returns the file's number of orphans'''
+    if 'orphans' not in file or release:
+      file['orphans'] = file['index'].orphans(transitive=self.transitive)
+      file['graph'] = file['index'].graph
+    with self._phase('report'):
+      self._log_orphans(file)
+      if writer:
+        writer.write_file(file, file['index'].lineage)
+    orphan_count = sum(len(orphans) for orphans in file['orphans'].values())
+    if release:
+      for key in ('index', 'orphans', 'graph'):
+        file.pop(key, None)
     return orphan_count
-  def reap_orphans(self,orphans):
-    pass
+  def index_files(self, files, on_indexed=None):
+    '''Set file['index'] for each of the given files, from the result cache or by analyzing them in a process pool or in this process.
+    on_indexed, if given, is called with each file once its index is set and stored in the cache: files analyzed in this process
+    first, then files analyzed by worker processes.  Returns False if any file could not be analyzed'''
+    # files read by path and archive members are handed to worker processes when running in parallel, which also look them up in the
+    # cache.  stdin and files whose lines were supplied by the caller are always analyzed in this process
+    pool_files = []
+    try:
+      for file in files:
+        if self.jobs > 1 and 'lines' not in file and 'fd' not in file:
+          pool_files.append(file)
+        elif not self._index_local(file, on_indexed):
+          return False
+    finally:
+      self.archives.close()
+    if pool_files:
+      with self._phase('parallel analysis'):
+        if not self._index_parallel(pool_files, on_indexed):
+          return False
+    if self.cache:
+      with self._phase('cache store'):
+        self.cache.evict()
+      self.logger.debug("Result cache hits: %s, misses: %s", self.cache.hits, self.cache.misses)
+    return True
+  def _index_local(self, file, on_indexed):
+    '''Index one file in this process, from the result cache if it holds the file's current content.  Returns False if it could not
+    be analyzed'''
+    # lines supplied by the caller are left in place, lines read here are released as soon as the file is indexed
+    with self._phase('read'):
+      try:
+        opened = self.open_file(file)
+      except inputs.READ_ERRORS as exc:
+        self.logger.error("Failed to read input file %s: %s", file['filename'], exc)
+        return False
+    with self._phase('cache lookup'):
+      cached = self._load_cached_index(file)
+    if not cached:
+      with self._phase('analysis'):
+        file['index'] = self.templates.get_index(file, with_graph=self.with_graph, with_lineage=self.with_lineage)
+      if self.cache and file['index'] is not None:
+        with self._phase('cache store'):
+          self.cache.put(file['cache_key'], file['index'].to_dict())
+    if opened:
+      self.close_file(file)
+    if file['index'] is None:
+      return False
+    if on_indexed:
+      on_indexed(file)
+    return True
+  def group_key(self, file):
+    '''Return the group of a file: the `group` group of group_pattern's match of its filename if the pattern has one, else the whole
+    match.  A file which does not match is a group of its own'''
+    group_match = self.group_pattern.search(file['filename'])
+    group = None
+    if group_match:
+      group = group_match.group('group') if 'group' in self.group_pattern.groupindex else group_match.group(0)
+    if not group:
+      self.logger.debug("File %s does not match the group pattern and is analyzed on its own", file['filename'])
+      return file['filename']
+    return group
+  def resolve_orphans(self):
+    '''Set the orphans of every file in self.files from its own index, or when grouping from the index of all files of the same
+    template and group.  Every file must have been indexed by index_files()'''
+    if not self.group_pattern:
+      for file in self.files:
+        file['orphans'] = file['index'].orphans(transitive=self.transitive)
+        file['graph'] = file['index'].graph
+      return
+    # one index per (template slug, group key), each file's names are merged in as they are visited
+    group_indexes = {}
+    for file in self.files:
+      file['group'] = self.group_key(file)
+      group_key = (file['template'], file['group'])
+      if group_key not in group_indexes:
+        group_indexes[group_key] = index.NameIndex()
+      group_indexes[group_key].update(file['index'])
+    self.logger.debug("Grouped %s files into %s groups", len(self.files), len(group_indexes))
+    for file in self.files:
+      group_index = group_indexes[(file['template'], file['group'])]
+      file['orphans'] = group_index.orphans(file['index'].objects, transitive=self.transitive)
+      file['graph'] = group_index.graph
+  def _load_cached_index(self, file):
+    '''Set file['index'] from the result cache and return True if an index is stored for the current content and template of a file
+    whose lines are loaded.  Otherwise remember the file's cache key in file['cache_key'] so that its index can be stored once it is
+    computed'''
+    if not self.cache:
+      return False
+    file['cache_key'] = _cache_key(self.templates, file, self.cache_mode)
+    stored = self.cache.get(file['cache_key'])
+    if stored is None:
+      return False
+    self.logger.debug("Using cached results for file %s", file['filename'])
+    file['index'] = index.NameIndex.from_dict(stored)
+    return True
+  def _log_orphans(self, file):
+    '''Log every orphan found in a file'''
+    # checked once per file, so that quiet runs make no logging calls per orphan
+    if not self.logger.isEnabledFor(logging.INFO):
+      return
+    reason = "has no references outside of orphans" if self.transitive else "has no references"
+    for obj_definition_slug, obj_names in file['orphans'].items():
+      for obj_name in sorted(obj_names):
+        self.logger.info("%s %s %s %s", file['filename'], obj_definition_slug, obj_name, reason)
+  def open_pool(self):
+    '''Start a process pool of self.jobs workers which every later index_files() call uses until close_pool().  Does nothing unless
+    running in parallel'''
+    if self.jobs > 1 and self.pool is None:
+      self.pool = self._new_pool(self.jobs)
+  def close_pool(self):
+    '''Stop the process pool started by open_pool(), if any'''
+    if self.pool:
+      self.pool.shutdown()
+      self.pool = None
+  def _new_pool(self, workers):
+    # deferred, since runs without a process pool never need it
+    import concurrent.futures
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self.ucf, self.dcf, self.templates.artifact_dir, self.templates.trace, self.cache.cache_dir if self.cache else None, self.cache.max_bytes if self.cache else None))
+  def _index_parallel(self, files, on_indexed=None):
+    '''Index the given files in the pool started by open_pool(), or else in a pool of up to self.jobs worker processes started for
+    this call.  Workers are sent only the template slug and path of each file, or runs of members of an archive, and read, digest and
+    look them up in the result cache themselves; results are stored in each file's 'index' and handed to on_indexed in the order of
+    the files list, archive members last, regardless of completion order'''
+    path_files = [file for file in files if 'member' not in file]
+    archive_chunks = self._archive_chunks([file for file in files if 'member' in file])
+    workers = self.jobs if self.pool else min(self.jobs, len(path_files) + len(archive_chunks))
+    # a few chunks per worker keeps inter-process overhead low for large fleets while still balancing uneven file sizes
+    chunksize = max(1, len(path_files) // (workers * 4))
+    self.logger.info("Analyzing %s files with %s worker processes", len(files), workers)
+    # deferred like the pool itself
+    import concurrent.futures
+    options = (self.cache_mode, self.with_graph, self.with_lineage, self.profiler is not None)
+    executor = self.pool if self.pool else self._new_pool(workers)
+    chunk_futures = []
+    try:
+      # archive chunks are submitted first, as each one is a large task
+      chunk_futures = [executor.submit(_index_archive_worker, chunk[0]['archive'], [(file['template'], file['member'], file.get('member_offset'), file['filename']) for file in chunk], *options) for chunk in archive_chunks]
+      results = executor.map(_index_worker, [file['template'] for file in path_files], [file['filename'] for file in path_files], *([option] * len(path_files) for option in options), chunksize=chunksize)
+      for file, result in zip(path_files, results):
+        if not self._pool_result(file, result, on_indexed):
+          return False
+      for chunk, future in zip(archive_chunks, chunk_futures):
+        for file, result in zip(chunk, future.result()):
+          if not self._pool_result(file, result, on_indexed):
+            return False
+    except Exception as exc:
+      self.logger.error("Parallel analysis failed: %s", exc)
+      if executor is self.pool and isinstance(exc, concurrent.futures.process.BrokenProcessPool):
+        # a pool which lost a worker process cannot run any more tasks, so the next call starts a new one
+        self.close_pool()
+        self.open_pool()
+      return False
+    finally:
+      # tasks of a failed call are not left running in a pool which outlives it
+      for future in chunk_futures:
+        future.cancel()
+      if executor is not self.pool:
+        executor.shutdown()
+    return True
+  def _archive_chunks(self, members):
+    '''Split archive member records into runs of consecutive members of the same archive, up to self.jobs runs per archive, so that
+    the members of one large archive are spread over the workers while each worker still reads its members in archive order.  Each
+    worker decompresses a compressed tarball from its beginning up to the end of its run'''
+    by_archive = {}
+    for file in members:
+      by_archive.setdefault(file['archive'], []).append(file)
+    chunks = []
+    for archive_members in by_archive.values():
+      chunk_size = -(-len(archive_members) // self.jobs)
+      chunks.extend(archive_members[start:start + chunk_size] for start in range(0, len(archive_members), chunk_size))
+    return chunks
+  def _pool_result(self, file, result, on_indexed):
+    '''Store the (index, profiling data, cached) result of a worker task in its file record.  Returns False if the file failed'''
+    file_index, profile_data, cached = result
+    if file_index is None:
+      self.logger.error("Worker process failed to index file %s", file['filename'])
+      return False
+    file['index'] = file_index
+    if profile_data:
+      self.profiler.update(profile_data)
+    if self.cache:
+      # the lookup and store happened in the worker, whose counters are not shared with this process
+      if cached:
+        self.cache.hits += 1
+      else:
+        self.cache.misses += 1
+        self.cache.puts += 1
+    if on_indexed:
+      on_indexed(file)
+    return True
+  def analyze(self, config_text, template_slug, name='-', encoding='utf-8'):
+    '''Find the orphans of one configuration held in memory, as a str, bytes or an iterable of str or bytes lines, analyzed in
+    isolation and without touching self.files.  Returns the file record with 'orphans' set as by find_orphans() and 'index' holding
+    its index.NameIndex, or None if the template is not loaded.  Safe to call from several threads sharing this Reaper only when
+    profiling is off, as the profiler is not synchronized; the result cache hit and miss counters may then undercount'''
+    return self._analyze_lines(name, template_slug, inputs.config_lines(config_text, encoding))
+  async def analyze_async(self, config_text, template_slug, name='-', encoding='utf-8', executor=None):
+    '''Coroutine version of analyze() which also accepts an async iterable of lines.  Lines are collected in the event loop, then
+    analyzed in executor, which defaults to the loop's default executor'''
+    # deferred, since only callers of the async API need it and it is slow to import
+    import asyncio
+    if hasattr(config_text, '__aiter__'):
+      lines = [inputs.config_line(line, encoding) async for line in config_text]
+    else:
+      lines = inputs.config_lines(config_text, encoding)
+    return await asyncio.get_running_loop().run_in_executor(executor, self._analyze_lines, name, template_slug, lines)
+  async def analyze_batch(self, configs, executor=None, encoding='utf-8'):
+    '''Coroutine analyzing many configurations concurrently.  configs is an iterable of (name, template slug, config) tuples, where each
+    config is anything analyze_async() accepts.  Analysis runs in executor, which defaults to the loop's default executor; it must run
+    calls in this process, e.g. a ThreadPoolExecutor, so that every device shares this Reaper's loaded Templates.  Returns the results
+    of analyze() in the order of configs'''
+    # deferred, since only callers of the async API need it and it is slow to import
+    import asyncio
+    results = await asyncio.gather(*(self.analyze_async(config_text, template_slug, name, encoding, executor) for name, template_slug, config_text in configs))
+    if self.cache:
+      await asyncio.get_running_loop().run_in_executor(executor, self.cache.evict)
+    return results
+  def _analyze_lines(self, name, template_slug, lines):
+    '''Index and resolve the orphans of one configuration's lines, using the result cache if it is enabled'''
+    if template_slug not in self.templates.compiled:
+      self.logger.error("Template with slug `%s` not found, not analyzing %s", template_slug, name)
+      return None
+    file = {'filename':name, 'template':template_slug, 'lines':lines}
+    if not self._index_local(file, None):
+      return None
+    self.close_file(file)
+    file['orphans'] = file['index'].orphans(transitive=self.transitive)
+    file['graph'] = file['index'].graph
+    return file
+  def reap_orphans(self, output=None, output_dir=None, batch_lines=1000):
+    '''Write removal configlets for the orphans found by find_orphans, built from the cleanup format strings of each template.  With
+    output_dir, one file per device (the group of a file when grouping, otherwise its file name) is written there, otherwise all
+    configlets are written to output, which defaults to stdout.  Lines are streamed in batches of batch_lines rather than built up in
+    memory.  Returns the number of cleanup lines written, or None if orphans were not kept by find_orphans or two devices would be
+    written to the same file'''
+    unresolved = [file['filename'] for file in self.files if 'orphans' not in file]
+    if unresolved:
+      self.logger.error("No orphans are known for %s files, e.g. %s.  Call find_orphans() first, and create the Reaper with reap=True when streaming its results to a writer", len(unresolved), unresolved[0])
+      return None
+    lines_written = 0
+    # output file paths already written by this call: the first file for a device truncates it, later ones append to it
+    opened_paths = set()
+    device_names = self._device_names() if output_dir else None
+    if output_dir and device_names is None:
+      return None
+    with self._phase('cleanup generation'):
+      for file in self.files:
+        if not any(file['orphans'].values()):
+          continue
+        if output_dir:
+          path = os.path.join(output_dir, device_names[self._device(file)] + '.cleanup')
+          with open(path, 'a' if path in opened_paths else 'w', buffering=1 << 20) as f:
+            lines_written += self._write_batched(f, self.generate_configlet(file), batch_lines)
+          opened_paths.add(path)
+        else:
+          lines_written += self._write_batched(output if output else sys.stdout, self.generate_configlet(file), batch_lines)
+    self.logger.info("Wrote %s cleanup lines for %s files", lines_written, len(self.files))
+    return lines_written
+  def _device(self, file):
+    '''The device an input file belongs to: its group when grouping, otherwise its file name'''
+    return file.get('group', file['filename'])
+  def _device_name(self, file):
+    '''Name of the configlet file for an input file, before collisions with other devices are resolved'''
+    if self._device(file) != file['filename']:
+      return re.sub(r'[^A-Za-z0-9_.-]', '_', file['group'].strip(os.sep))
+    return 'stdin' if file['filename'] == '-' else os.path.basename(file['filename'])
+  def _device_names(self):
+    '''Return a dict of each device in self.files to the name of its configlet file.  Devices whose names collide, such as
+    dir/r1.cfg and dir/sub/r1.cfg, are named by their path relative to the deepest directory they share instead.  Logs an error and
+    returns None if names still collide'''
+    device_names = {}
+    for file in self.files:
+      device_names.setdefault(self._device(file), self._device_name(file))
+    devices_by_name = {}
+    for device, name in device_names.items():
+      devices_by_name.setdefault(name, []).append(device)
+    for devices in devices_by_name.values():
+      if len(devices) > 1:
+        root = os.path.commonpath([os.path.abspath(device) for device in devices])
+        for device in devices:
+          device_names[device] = re.sub(r'[^A-Za-z0-9_.-]', '_', os.path.relpath(os.path.abspath(device), root))
+    if len(set(device_names.values())) < len(device_names):
+      self.logger.error("Devices would share removal configlet files, not writing configlets: %s", ', '.join(sorted(
+        device for device, name in device_names.items() if list(device_names.values()).count(name) > 1)))
+      return None
+    return device_names
+  def _write_batched(self, f, lines, batch_lines):
+    '''Write newline-terminated lines from an iterable to f with one writelines() call per batch_lines lines.  Returns the count'''
+    batch = []
+    count = 0
+    for line in lines:
+      batch.append(line + '\n')
+      if len(batch) >= batch_lines:
+        f.writelines(batch)
+        count += len(batch)
+        batch = []
+    f.writelines(batch)
+    return count + len(batch)
+  def generate_configlet(self, file):
+    '''Generator of the lines of one file's removal configlet.  An orphan referencing other orphans is removed before them, for example
+    a route-map before the prefix-lists it matches, so that no line removes an object which is still in use'''
+    template = self.templates.get_compiled(file['template'])
+    comment = template.config_contents['meta'].get('comment')
+    if comment:
+      yield '%s orphanreaper cleanup for %s' % (comment, file['filename'])
+    for slug, name in self._removal_order(file, template):
+      cleanup = template.object_defs[slug].get('cleanup')
+      if cleanup:
+        yield cleanup % name
+      else:
+        self.logger.warning("Template `%s` has no cleanup for object `%s`, not removing %s from %s", file['template'], slug, name, file['filename'])
+  def _removal_order(self, file, template):
+    '''Return the orphans of a file as (slug, name) tuples sorted so that each orphan comes before any orphan it references.  Ties are
+    ordered by the template's object order, then by name, and a reference cycle is broken at its first orphan in that order'''
+    object_order = {obj_def['slug']: position for position, (obj_def, obj_regex, references) in enumerate(template.objects)}
+    sort_key = lambda node: (object_order[node[0]], node[1])
+    orphans = sorted(((slug, name) for slug, names in file['orphans'].items() for name in names), key=sort_key)
+    reference_graph = file.get('graph')
+    if reference_graph is None:
+      # direct orphans never reference each other
+      return orphans
+    # Kahn's algorithm over the references between orphans
+    orphan_set = set(orphans)
+    referenced_by_count = dict.fromkeys(orphans, 0)
+    for node in orphans:
+      for target in reference_graph.edges.get(node, ()):
+        if target in orphan_set:
+          referenced_by_count[target] += 1
+    ordered = []
+    emitted = set()
+    ready = [node for node in orphans if not referenced_by_count[node]]
+    while len(ordered) < len(orphans):
+      if ready:
+        ready.sort(key=sort_key, reverse=True)
+        node = ready.pop()
+      else:
+        # every orphan left is referenced by another one left, so some of them reference each other in a cycle.  Its first orphan is
+        # removed next, and orphans only referenced from the cycle still follow it
+        left = [node for node in orphans if node not in emitted]
+        left_set = set(left)
+        node = next((node for node in left if self._on_cycle(node, reference_graph, left_set)), left[0])
+      ordered.append(node)
+      emitted.add(node)
+      for target in reference_graph.edges.get(node, ()):
+        if target in orphan_set and target not in emitted:
+          referenced_by_count[target] -= 1
+          if not referenced_by_count[target]:
+            ready.append(target)
+    return ordered
+  def _on_cycle(self, node, reference_graph, nodes):
+    '''True if node references itself through references between the given nodes'''
+    seen = set()
+    pending = [target for target in reference_graph.edges.get(node, ()) if target in nodes]
+    while pending:
+      current = pending.pop()
+      if current == node:
+        return True
+      if current not in seen:
+        seen.add(current)
+        pending.extend(target for target in reference_graph.edges.get(current, ()) if target in nodes)
+    return False
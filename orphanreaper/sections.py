@@ -0,0 +1,111 @@
+'''Builders of the parent/child hierarchy of configuration lines, driven by a template's meta.section style'''
+import array
+
+SECTION_STYLES = ('indent', 'braces', 'brackets', 'prefix')
+# parsers which may be selected with meta.parser in a template.  ciscoconfparse only understands indented sections
+PARSERS = ('native', 'ciscoconfparse')
+DEFAULT_SECTION_PREFIX = '/'
+
+class Hierarchy():
+  '''Compact parent/child index of a file's lines.  parents[i] is the line number of the parent of line i, or -1 for a top-level line'''
+  def __init__(self, parents):
+    self.parents = parents
+  def parent(self, line_number):
+    '''Return the line number of the parent of a line, or None for a top-level line'''
+    parent = self.parents[line_number]
+    return parent if parent >= 0 else None
+  def ancestors(self, line_number):
+    '''Generator of the line numbers of a line's ancestors, nearest first'''
+    parent = self.parents[line_number]
+    while parent >= 0:
+      yield parent
+      parent = self.parents[parent]
+
+def build_hierarchy(lines, section, prefix=DEFAULT_SECTION_PREFIX):
+  '''Build the Hierarchy of lines for one of the SECTION_STYLES'''
+  if section == 'indent':
+    parents = _indent_parents(lines)
+  elif section == 'braces':
+    parents = _delimited_parents(lines, '{', '}')
+  elif section == 'brackets':
+    parents = _delimited_parents(lines, '[', ']')
+  elif section == 'prefix':
+    parents = _prefix_parents(lines, prefix)
+  else:
+    raise ValueError("unknown section style `%s`, expected one of: %s" % (section, ', '.join(SECTION_STYLES)))
+  return Hierarchy(parents)
+
+def _new_parents(lines):
+  return array.array('i', [-1]) * len(lines)
+
+def _indent_parents(lines):
+  '''A line is the child of the nearest preceding line with less indentation.  Blank lines are left at the top level'''
+  parents = _new_parents(lines)
+  # stack of (indentation, line number) of the currently open sections
+  stack = []
+  for line_number, line in enumerate(lines):
+    content = line.lstrip()
+    if not content:
+      continue
+    indent = len(line) - len(content)
+    while stack and stack[-1][0] >= indent:
+      stack.pop()
+    if stack:
+      parents[line_number] = stack[-1][1]
+    stack.append((indent, line_number))
+  return parents
+
+def _delimited_parents(lines, opener, closer):
+  '''A line is the child of the innermost open section.  A line opens a section when it contains more openers than closers, and a
+  line beginning with a closer belongs to the section it closes'''
+  parents = _new_parents(lines)
+  # line numbers of the currently open sections, repeated when one line opens several
+  stack = []
+  for line_number, line in enumerate(lines):
+    content = line.strip()
+    if not content:
+      continue
+    depth_change = content.count(opener) - content.count(closer)
+    if stack:
+      parents[line_number] = stack[-1]
+    if content.startswith(closer) and stack:
+      stack.pop()
+      depth_change += 1
+    for _ in range(depth_change):
+      stack.append(line_number)
+    for _ in range(-depth_change):
+      if not stack:
+        break
+      stack.pop()
+  return parents
+
+def _prefix_parents(lines, prefix):
+  '''A line beginning with prefix opens a top-level section, for example `/ip firewall filter`, and every following line which does
+  not begin with prefix is its child'''
+  parents = _new_parents(lines)
+  header = -1
+  for line_number, line in enumerate(lines):
+    if line.startswith(prefix):
+      header = line_number
+    elif line.strip():
+      parents[line_number] = header
+  return parents
+
+def hierarchy_from_ciscoconfparse(tree, lines):
+  '''Build the Hierarchy of lines from a ciscoconfparse tree of them.  ciscoconfparse drops blank lines and renumbers the rest, so
+  its objects are aligned back to the original line numbers by their text'''
+  parents = _new_parents(lines)
+  # map of ciscoconfparse linenum to original line number
+  original_line_numbers = {}
+  line_number = 0
+  for obj in tree.ConfigObjs:
+    while line_number < len(lines) and lines[line_number].rstrip() != obj.text.rstrip():
+      line_number += 1
+    if line_number >= len(lines):
+      raise ValueError("ciscoconfparse object `%s` could not be aligned with the input lines" % obj.text)
+    original_line_numbers[obj.linenum] = line_number
+    # top-level ciscoconfparse objects are their own parent
+    if obj.parent is not obj:
+      parents[line_number] = original_line_numbers[obj.parent.linenum]
+    line_number += 1
+  return Hierarchy(parents)
@@ -1,32 +1,301 @@
-import ciscoconfparse
 import glob
+import hashlib
+import json
 import logging
+import os
 import re
+import time
 import yaml
+from . import graph
+from . import index
+from . import inputs
+from . import sections
 
 
-'''The below class is not in use, but may be developed further if the Templates class 
-becomes too cluttered with helpers for the actual template-specific logic'''
+# bump when the contents of the compiled template artifact change, so that artifacts written by older versions are rebuilt
+ARTIFACT_FORMAT = 4
+
+# matches the opening of a named group, used to turn template regexes into plain groups when they are combined into one prefilter
+_NAMED_GROUP_RE = re.compile(r'\(\?P<[A-Za-z_][A-Za-z0-9_]*>')
+# matches an unescaped numbered or named backreference, or a conditional on a group.  Group numbers change when regexes are combined,
+# so templates using one get no prefilter
+_BACKREFERENCE_RE = re.compile(r'(?:^|[^\\])(?:\\\\)*(?:\\[1-9]|\(\?P=|\(\?\()')
+
 class Template():
-  '''Helper class for handling file content with a specific template's behavior'''
+  '''Helper class for handling file content with a specific template's behavior.  Holds the compiled object and reference regexes
+  of one template so that input lines can be classified in a single pass'''
   def __init__(self, config_contents, logger=None):
     self.logger = logger if logger else logging.getLogger()
     self.config_contents = config_contents
     self.section = None
+    # line prefix which opens a section when section is 'prefix'
+    self.section_prefix = None
+    # 'native' or 'ciscoconfparse', selects how the hierarchy of input lines is built
+    self.parser = None
+    # list of (obj_def, compiled object regex, list of (reference_def, compiled reference regex))
+    self.objects = []
+    # dictionary of object slug to obj_def
+    self.object_defs = {}
+    # one combined regex matching any line that at least one object or reference regex matches, or None if it could not be built
+    self.prefilter = None
+    # digest of everything in the template which affects analysis results, used to key cached results
+    self.fingerprint = None
 
     self.load()
   def load(self):
-    '''Load attributes/behavior from the configuration provided to __init__'''
+    '''Load attributes/behavior from the configuration provided to __init__, compiling every object and reference regex once'''
+    meta = self.config_contents['meta']
+    self.section = meta.get('section')
+    if self.section not in sections.SECTION_STYLES:
+      raise ValueError("meta.section `%s` is not one of: %s" % (self.section, ', '.join(sections.SECTION_STYLES)))
+    self.section_prefix = meta.get('section_prefix', sections.DEFAULT_SECTION_PREFIX)
+    self.parser = meta.get('parser', 'native')
+    if self.parser not in sections.PARSERS:
+      raise ValueError("meta.parser `%s` is not one of: %s" % (self.parser, ', '.join(sections.PARSERS)))
+    if self.parser == 'ciscoconfparse' and self.section != 'indent':
+      raise ValueError("meta.parser ciscoconfparse only supports meta.section indent, not `%s`" % self.section)
+    self.objects = []
+    self.object_defs = {}
+    patterns = []
+    for obj_def in self.config_contents['objects']:
+      obj_regex = self._compile(obj_def)
+      references = []
+      for reference_def in obj_def.get('references') or []:
+        references.append((reference_def, self._compile(reference_def)))
+        patterns.append(reference_def['regex'])
+      self.objects.append((obj_def, obj_regex, references))
+      self.object_defs[obj_def['slug']] = obj_def
+      patterns.append(obj_def['regex'])
+    self.prefilter = None
+    if any(_BACKREFERENCE_RE.search(pattern) for pattern in patterns):
+      self.logger.debug("Template `%s` regexes use backreferences, which cannot be combined into a prefilter, every line will be tested against each regex", meta.get('slug'))
+    else:
+      try:
+        self.prefilter = re.compile('|'.join('(?:%s)' % _NAMED_GROUP_RE.sub('(?:', pattern) for pattern in patterns))
+      except re.error as exc:
+        # e.g. a template regex uses global inline flags, which are only permitted at the start of a pattern
+        self.logger.debug("Template `%s` regexes could not be combined into a prefilter, every line will be tested against each regex: %s", meta.get('slug'), exc)
+    self.fingerprint = hashlib.sha256(json.dumps([
+      self.section,
+      self.section_prefix,
+      # the parsers may build different hierarchies, and with them different graphs and lineage, from the same lines
+      self.parser,
+      [[obj_def['slug'], obj_def['regex'], [reference_def['regex'] for reference_def, reference_regex in references]] for obj_def, obj_regex, references in self.objects],
+    ]).encode()).hexdigest()
+  def _compile(self, definition):
+    '''Compile the regex of an object or reference definition, raising ValueError if it is invalid or does not capture a name'''
+    try:
+      compiled = re.compile(definition['regex'])
+    except re.error as exc:
+      raise ValueError("regex `%s` of `%s` is invalid: %s" % (definition['regex'], definition['name'], exc))
+    if 'name' not in compiled.groupindex:
+      raise ValueError("regex `%s` of `%s` does not contain a (?P<name>...) group" % (definition['regex'], definition['name']))
+    return compiled
+  def scan(self, lines):
+    '''Generator classifying every line in a single pass.  Yields (line_number, obj_def, name, reference_def) tuples; reference_def
+    is None when the line defines the object rather than referencing it.  Line numbers are 0-based indexes into lines'''
+    prefilter = self.prefilter.search if self.prefilter else None
+    objects = self.objects
+    for line_number, line in enumerate(lines):
+      if prefilter and not prefilter(line):
+        continue
+      for obj_def, obj_regex, references in objects:
+        name_match = obj_regex.search(line)
+        if name_match:
+          yield line_number, obj_def, name_match.group('name'), None
+          # a line that defines this object is never counted as a reference to an object of the same type
+          continue
+        # there can be multiple reference in a single line, for example a route-map can be referred to in a BGP aggregate
+        # at least 2 times: attribute-map, suppress-map, etc.
+        for reference_def, reference_regex in references:
+          for name_match in reference_regex.finditer(line):
+            yield line_number, obj_def, name_match.group('name'), reference_def
+  def scan_profiled(self, lines, profiler):
+    '''Same as scan(), additionally counting lines tested, matches and time spent per regex into a profiling.Profiler'''
+    perf_counter = time.perf_counter
+    slug = self.config_contents['meta'].get('slug')
+    prefilter = self.prefilter.search if self.prefilter else None
+    prefilter_stats = profiler.regex_stats((slug, 'prefilter', '', 'all objects and references', '(combined)'))
+    objects = [
+      (obj_def, obj_regex, profiler.regex_stats((slug, 'object', obj_def['slug'], obj_def['name'], obj_def['regex'])),
+        [(reference_def, reference_regex, profiler.regex_stats((slug, 'reference', obj_def['slug'], reference_def['name'], reference_def['regex']))) for reference_def, reference_regex in references])
+      for obj_def, obj_regex, references in self.objects
+    ]
+    for line_number, line in enumerate(lines):
+      if prefilter:
+        start = perf_counter()
+        candidate = prefilter(line)
+        prefilter_stats[2] += perf_counter() - start
+        prefilter_stats[0] += 1
+        if not candidate:
+          continue
+        prefilter_stats[1] += 1
+      for obj_def, obj_regex, obj_stats, references in objects:
+        start = perf_counter()
+        name_match = obj_regex.search(line)
+        obj_stats[2] += perf_counter() - start
+        obj_stats[0] += 1
+        if name_match:
+          obj_stats[1] += 1
+          yield line_number, obj_def, name_match.group('name'), None
+          continue
+        for reference_def, reference_regex, reference_stats in references:
+          start = perf_counter()
+          name_matches = list(reference_regex.finditer(line))
+          reference_stats[2] += perf_counter() - start
+          reference_stats[0] += 1
+          reference_stats[1] += len(name_matches)
+          for name_match in name_matches:
+            yield line_number, obj_def, name_match.group('name'), reference_def
+
+class ParsedFile():
+  '''Parsed representation of one input file, built once by Templates.parse() and cached on the file record so that object discovery,
+  reference discovery and cleanup generation all share it'''
+  def __init__(self, template, lines):
+    self.template = template
+    self.lines = lines
+    # dicts of object slugs to set of names of that type of object, defined in or referenced by the file
+    self.objects = {obj_def['slug']: set() for obj_def, obj_regex, references in template.objects}
+    self.references = {obj_def['slug']: set() for obj_def, obj_regex, references in template.objects}
+    # lists of (line_number, object slug, name) and (line_number, object slug, name, reference definition name) in file order
+    self.definition_lines = []
+    self.reference_lines = []
+    self._tree = None
+    self._hierarchy = None
+    self._graph = None
+  @property
+  def tree(self):
+    '''ciscoconfparse parse tree of the file's lines, built on first access only since object and reference discovery do not need it'''
+    if self._tree is None:
+      import ciscoconfparse
+      self._tree = ciscoconfparse.CiscoConfParse(config=self.lines)
+    return self._tree
+  @property
+  def hierarchy(self):
+    '''sections.Hierarchy of the file's lines, built on first access by the parser selected with the template's meta.parser'''
+    if self._hierarchy is None:
+      if self.template.parser == 'ciscoconfparse':
+        self._hierarchy = sections.hierarchy_from_ciscoconfparse(self.tree, self.lines)
+      else:
+        self._hierarchy = sections.build_hierarchy(self.lines, self.template.section, self.template.section_prefix)
+    return self._hierarchy
+  @property
+  def graph(self):
+    '''graph.ReferenceGraph of the file, built on first access in one pass over its references.  Each reference is attributed to the
+    object defined on the same line or on its nearest ancestor line'''
+    if self._graph is None:
+      definitions_by_line = {}
+      for line_number, slug, name in self.definition_lines:
+        definitions_by_line.setdefault(line_number, (slug, name))
+      self._graph = graph.ReferenceGraph()
+      for line_number, slug, name, reference_name in self.reference_lines:
+        container = definitions_by_line.get(line_number)
+        if container is None:
+          for ancestor in self.hierarchy.ancestors(line_number):
+            container = definitions_by_line.get(ancestor)
+            if container is not None:
+              break
+        self._graph.add_reference(container, (slug, name))
+    return self._graph
+  def lineage(self):
+    '''Return a dict of object slugs to dicts of names to (line_number, parent_path) of the first definition of each object in the
+    file.  parent_path is the list of the stripped lines of the sections enclosing the definition, outermost first'''
+    lineage = {obj_def['slug']: {} for obj_def, obj_regex, references in self.template.objects}
+    for line_number, slug, name in self.definition_lines:
+      if name not in lineage[slug]:
+        ancestors = list(self.hierarchy.ancestors(line_number))
+        lineage[slug][name] = (line_number, [self.lines[ancestor].strip() for ancestor in reversed(ancestors)])
+    return lineage
 
 class Templates():
   '''Class to load the vendor/OS-specific template yaml which defines the objects that the tool should inspect and clean up'''
-  def __init__(self, config, logger=None):
+  def __init__(self, config, logger=None, artifact_dir=None):
     self.logger = logger if logger else logging.getLogger()
     self.config = config
+    # directory holding the compiled template artifact, which saves reading and parsing the template YAML files on every run.  None
+    # always loads templates from their files
+    self.artifact_dir = artifact_dir
     self.index = None
+    # dictionary of template slug to compiled Template, built by load()
+    self.compiled = None
+    # profiling.Profiler collecting parse times and per-regex counters, or None when profiling is off
+    self.profiler = None
+    # when True, every definition and reference matched is logged at debug level with its line.  Checked once per file, so that
+    # parsing without tracing makes no logging calls per line
+    self.trace = False
   def load(self):
-    '''Public method for triggering load of template files, and secondary actions such as building the index of templates based on name'''
-    return self._load() and self._build_template_index()
+    '''Public method for triggering load of template files, and secondary actions such as building the index of templates based on name.
+    With an artifact_dir, the result is saved as a compiled artifact, which later loads use instead while the template files are unchanged'''
+    sources = self._template_sources() if self.artifact_dir else None
+    if sources and self._load_artifact(sources):
+      return True
+    loaded = self._load() and self._build_template_index() and self._compile_templates()
+    if not loaded:
+      # templates which were indexed but not compiled must never be used
+      self.index = None
+      self.compiled = None
+    elif sources:
+      self._save_artifact(sources)
+    return loaded
+  def _template_sources(self):
+    '''Return the (path, mtime_ns, size) of every template file matched by each path_glob row of the configuration, which identifies
+    the compiled template artifact built from them.  Returns None if the configuration has no templates section'''
+    if not self.config.has_section('templates'):
+      return None
+    sources = []
+    for template_config_row in self.config.get_section('templates'):
+      row_sources = []
+      path_glob = template_config_row.get('path_glob')
+      for template_file_name in sorted(glob.glob(self.config.resolve_path(path_glob))) if path_glob else []:
+        try:
+          stat = os.stat(template_file_name)
+        except OSError:
+          return None
+        row_sources.append([os.path.abspath(template_file_name), stat.st_mtime_ns, stat.st_size])
+      sources.append(row_sources)
+    return [ARTIFACT_FORMAT, sources]
+  def _artifact_path(self):
+    return os.path.join(os.path.expanduser(self.artifact_dir), 'templates.json')
+  def _load_artifact(self, sources):
+    '''Load templates from the compiled template artifact if it was built from the current template files.  The artifact only holds
+    the template contents as JSON, which are indexed and compiled again exactly as if they had been read from the template files.
+    Returns True on success'''
+    try:
+      with open(self._artifact_path()) as f:
+        artifact = json.load(f)
+    except FileNotFoundError:
+      return False
+    except (OSError, ValueError) as exc:
+      self.logger.debug("Ignoring unreadable compiled template artifact %s: %s", self._artifact_path(), exc)
+      return False
+    if not isinstance(artifact, dict) or artifact.get('sources') != sources:
+      self.logger.debug("Compiled template artifact %s is out of date, reloading templates", self._artifact_path())
+      return False
+    try:
+      for template_config_row, file_contents in zip(self.config.get_section('templates'), artifact['file_contents']):
+        template_config_row['file_contents'] = file_contents
+      loaded = self._build_template_index() and self._compile_templates()
+    except (KeyError, TypeError, AttributeError) as exc:
+      self.logger.debug("Ignoring malformed compiled template artifact %s: %s", self._artifact_path(), exc)
+      return False
+    if not loaded:
+      return False
+    self.logger.debug("Loaded %s templates from compiled template artifact %s", len(self.compiled), self._artifact_path())
+    return True
+  def _save_artifact(self, sources):
+    '''Save the contents of the loaded and validated templates as an artifact which _load_artifact() can use while the template files
+    are unchanged'''
+    path = self._artifact_path()
+    try:
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with inputs.atomic_write(path) as f:
+        json.dump({
+          'sources': sources,
+          'file_contents': [template_config_row['file_contents'] for template_config_row in self.config.get_section('templates')],
+        }, f)
+    except (OSError, TypeError, ValueError) as exc:
+      # TypeError and ValueError are raised for YAML values which JSON cannot represent, such as dates
+      self.logger.warning("Failed to save compiled template artifact %s: %s", path, exc)
   def _load(self):
     '''Load all templates from globs listed in the configuration file'''
     number_of_loaded_templates = 0
@@ -39,7 +308,7 @@ class Templates():
       if 'path_glob' not in template_config_row:
         self.logger.warning("Skipping a row of configuration which does not contain any templates path_glob definition.  The content of this row is: %s", template_config_row)
         continue
-      template_files = glob.glob(template_config_row['path_glob'])
+      template_files = glob.glob(self.config.resolve_path(template_config_row['path_glob']))
       # dict of file path to contents
       template_config_row['file_contents'] = {}
       for template_file_name in template_files:
@@ -85,6 +354,17 @@ class Templates():
         templates_in_this_path[template_slug] = file_contents
     self.logger.debug("Template Index has loaded template slugs: %s", ','.join(self.index.keys()))
     return True
+  def _compile_templates(self):
+    '''To be used only after _build_template_index() - compile the regexes of every indexed template.  Log an error and return False
+    when a template contains a regex which cannot be used'''
+    self.compiled = {}
+    for template_slug, file_contents in self.index.items():
+      try:
+        self.compiled[template_slug] = Template(file_contents, logger=self.logger)
+      except ValueError as exc:
+        self.logger.error("Template `%s` could not be compiled: %s", template_slug, exc)
+        return False
+    return True
   def get(self, template_slug=None):
     '''Return a template when referenced by name.  Returns all templates when no name is specified'''
     if self.index is None:
@@ -96,90 +376,91 @@ class Templates():
       return self.index[template_slug]
     else:
       return None
- 
-  def get_objects(self, file):
-    '''Returns a dict of dicts describing configuration objects present in the given input file'''
-    parser = ciscoconfparse.CiscoConfParse(config=file['lines'])
-    template = self.get(file['template'])
+  def get_compiled(self, template_slug):
+    '''Return the compiled Template for a template slug, or None if it is not loaded'''
+    if self.compiled is None:
+      self.logger.error("Compiled templates have been accessed before they were built.  Application behavior may continue with incomplete results.")
+      return None
+    return self.compiled.get(template_slug)
+
+  def parse(self, file):
+    '''Return the ParsedFile for the given input file, classifying its lines in a single pass the first time and caching the result
+    in file['parsed'] afterwards.  Returns None if the file's template is not loaded'''
+    if file.get('parsed') is not None:
+      return file['parsed']
+    template = self.get_compiled(file['template'])
     if not template:
       self.logger.error("Template with slug `%s` not found, aborting search for objects", file['template'])
       return None
-    self.logger.debug("Parsing file `%s` using template `%s`", file['filename'], template['meta']['name'])
-    # dict of object slugs to set of names of that type of object
-    return_objects = {}
-    for obj_def in template['objects']:
-      self.logger.debug("Looking for objects of type `%s` with regex: %s", obj_def['slug'], obj_def['regex'])
-      if obj_def['slug'] not in return_objects:
-        return_objects[obj_def['slug']] = set()
-      cfg_line_matches = parser.find_lines(obj_def['regex'])
-      if cfg_line_matches:
-        self.logger.debug("In input file %s, found %s matching lines for template `%s` object definition `%s`", file['filename'], len(cfg_line_matches), file['template'], obj_def['name'])
-        # extract the object name
-        # TODO - precompile regexes back when the configs were loaded
-        for line in cfg_line_matches:
-          new_obj = {}
-          name_matches = re.search(obj_def['regex'], line)
-          if not name_matches:
-            self.logger.warning("In input file %s, the following line matched the initial search but a name could not be extracted.  Check template `%s` regex for object `%s`: %s", file['filename'], template['meta']['name'], obj_def['name'], line)
-            continue
-          self.logger.debug("Adding new object `%s` `%s`", obj_def['slug'], name_matches.group('name'))
-          return_objects[obj_def['slug']].add(name_matches.group('name'))
-    return return_objects
+    parsed = ParsedFile(template, file['lines'])
+    # the profiler is checked once per file so that unprofiled runs use the uninstrumented scan
+    profiler = self.profiler
+    if profiler:
+      start = time.perf_counter()
+      matches = template.scan_profiled(file['lines'], profiler)
+    else:
+      matches = template.scan(file['lines'])
+    if self.trace:
+      matches = self._traced(file, matches)
+    # the line numbers of definitions and references are kept alongside the names, ParsedFile.lineage() turns them into paths
+    objects, references = parsed.objects, parsed.references
+    add_definition, add_reference = parsed.definition_lines.append, parsed.reference_lines.append
+    for line_number, obj_def, name, reference_def in matches:
+      if reference_def is None:
+        objects[obj_def['slug']].add(name)
+        add_definition((line_number, obj_def['slug'], name))
+      else:
+        references[obj_def['slug']].add(name)
+        add_reference((line_number, obj_def['slug'], name, reference_def['name']))
+    if profiler:
+      seconds = time.perf_counter() - start
+      profiler.add_file(file['filename'], len(file['lines']), seconds)
+      profiler.add_phase('parse', seconds)
+    # one summary per file in place of per-line diagnostics, which are only logged when tracing
+    self.logger.debug("Parsed file `%s` using template `%s`: %s lines, %s definitions of %s objects, %s references to %s objects", file['filename'], file['template'], len(file['lines']),
+      len(parsed.definition_lines), sum(len(names) for names in objects.values()), len(parsed.reference_lines), sum(len(names) for names in references.values()))
+    file['parsed'] = parsed
+    return parsed
+  def _traced(self, file, matches):
+    '''Generator passing through the matches of Template.scan(), logging each one with its line'''
+    for line_number, obj_def, name, reference_def in matches:
+      if reference_def is None:
+        self.logger.debug("In file %s line %s, definition of object `%s` `%s`: %s", file['filename'], line_number + 1, obj_def['slug'], name, file['lines'][line_number])
+      else:
+        self.logger.debug("In file %s line %s, reference to object `%s` `%s`, reference type `%s`: %s", file['filename'], line_number + 1, obj_def['slug'], name, reference_def['name'], file['lines'][line_number])
+      yield line_number, obj_def, name, reference_def
+  def match(self, file):
+    '''Returns a tuple of two dicts mapping object slugs to sets of names: the objects defined in the given input file, and the
+    objects referenced by it.  Returns None if the file's template is not loaded'''
+    parsed = self.parse(file)
+    if parsed is None:
+      return None
+    return parsed.objects, parsed.references
+  def get_objects(self, file):
+    '''Returns a dict of sets naming the configuration objects of each type present in the given input file'''
+    matches = self.match(file)
+    return matches[0] if matches else None
   def get_references(self, file):
-    '''Returns a dictionary mapping of object-to-list-of-references for each object found in this file'''
-    parser = ciscoconfparse.CiscoConfParse(config=file['lines'])
-    template = self.get(file['template'])
-    if not template:
-      self.logger.error("Template with slug `%s` not found, aborting search for objects", file['template'])
+    '''Returns a dictionary mapping of object-type-to-set-of-referenced-names for each object type found in this file'''
+    matches = self.match(file)
+    return matches[1] if matches else None
+  def get_index(self, file, with_graph=False, with_lineage=False):
+    '''Returns the index.NameIndex of the objects defined and referenced by the given input file, including its reference graph when
+    with_graph is True and the line number and parent path of each definition when with_lineage is True.  Returns None if the file's
+    template is not loaded'''
+    parsed = self.parse(file)
+    if parsed is None:
       return None
-    self.logger.debug("Parsing file `%s` using template `%s`", file['filename'], template['meta']['name'])
-    return_references = {}
-    for obj_def in template['objects']:
-      if obj_def['slug'] not in return_references:
-        return_references[obj_def['slug']] = set()
-      # could possibly optimize in the future by combining
-      # all of the reference regexes into a single one?
-      # TODO -- instead of just tallying up references, save the lineage
-      # so that the user can be presented with the full config path to the reference in question
-      for reference_def in obj_def['references']:
-        cfg_line_matches = parser.find_lines(reference_def['regex'])
-        if cfg_line_matches:
-          self.logger.debug("In input file %s, found %s matching lines for template `%s`, object `%s` reference definition `%s`", file['filename'], len(cfg_line_matches), file['template'], obj_def['name'], reference_def['name'])
-          # extract the object name from the reference and make sure it matches
-          # TODO - precompile regexes back when the configs were loaded
-          for line in cfg_line_matches:
-            # safety -- make sure this line does not match the line that defines this object
-            if re.search(obj_def['regex'], line):
-              self.logger.debug("Skipping line `%s` due to it matching the definition of this object `%s`", line, obj_def['regex'])
-              continue
-            # loop through references matches in this line
-            # there can be multiple reference in a single line, for example a route-map can be referred to in a BGP aggregate
-            # at least 2 times: attribute-map, suppress-map, etc.
-            # flag if anything was found and added
-            references_found = False
-            for name_match in re.finditer(reference_def['regex'], line):
-              new_ref = {}
-              self.logger.debug("In file %s, adding reference for object `%s` `%s`, reference type `%s`, line: %s", file['filename'], obj_def['slug'], name_match.group('name'), reference_def['name'], line)
-              return_references[obj_def['slug']].add(name_match.group('name'))
-              references_found = True
-            # if nothing was found and added, log a warning because this is unexpected and may mean an odd failure/bad regex in the references definition
-            if not references_found:
-              self.logger.warning("In input file %s, the following line matched the initial reference search but a name could not be extracted.  Check template `%s` regex for reference `%s`: %s", file['filename'], template['meta']['name'], reference_def['name'], line)
-              continue
-    return return_references
-  def get_orphans(self, file):
-    '''Returns list of dicts describing configuration objects present in the given input file which have no known configuration references'''
-    objects = self.get_objects(file)
-    references = self.get_references(file)
-    return_orphans = {}
-    for obj_definition_slug, obj_instances in objects.items():
-      if obj_definition_slug not in return_orphans:
-        return_orphans[obj_definition_slug] = set()
-      for obj_name in obj_instances:
-        if obj_name not in references[obj_definition_slug]:
-          self.logger.info("%s %s %s has no references", file['filename'],obj_definition_slug, obj_name)
-          return_orphans[obj_definition_slug].add(obj_name)
-    return return_orphans
-
-
-
+    if with_graph and self.profiler:
+      with self.profiler.phase('reference graph'):
+        # accessing the property builds the hierarchy and graph inside the timed block
+        parsed.graph
+    return index.NameIndex.from_parsed(parsed, with_graph=with_graph, with_lineage=with_lineage)
+  def get_orphans(self, file, transitive=False):
+    '''Returns a dict of sets naming the configuration objects present in the given input file which have no known configuration references.
+    When transitive is True, objects which are only referenced from within orphaned objects, such as prefix-lists referenced only by an
+    orphaned route-map, are orphans as well'''
+    name_index = self.get_index(file, with_graph=transitive)
+    if name_index is None:
+      return None
+    return name_index.orphans(transitive=transitive)
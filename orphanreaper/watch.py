@@ -0,0 +1,177 @@
+'''Long-running mode which keeps an orphan inventory up to date as input files are added, modified or removed'''
+import datetime
+import json
+import logging
+import os
+import socketserver
+import stat
+import threading
+import time
+from . import inputs
+
+class _InventoryHandler(socketserver.BaseRequestHandler):
+  '''Sends the current inventory JSON to each client which connects, then closes the connection'''
+  def handle(self):
+    self.request.sendall(self.server.watcher.inventory_json.encode())
+
+class _InventoryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+class Watcher():
+  '''Polls the files and directories given as (template slug, path) tuples, re-analyzes only files which were added or modified
+  since the previous poll with a Reaper built once, and publishes the resulting inventory of orphans.  The inventory is rewritten
+  atomically to inventory_file and/or served as JSON to each client connecting to the Unix socket at socket_path'''
+  def __init__(self, reaper, watched, interval=10.0, inventory_file=None, socket_path=None, logger=None):
+    self.logger = logger if logger else logging.getLogger()
+    self.reaper = reaper
+    # list of (template slug, file or directory path)
+    self.watched = watched
+    self.interval = interval
+    self.inventory_file = inventory_file
+    self.socket_path = socket_path
+    # filename to (template slug, mtime_ns, size) as of the last successful poll
+    self.snapshot = {}
+    # filename to file record, with each record's index kept so that unchanged files are not analyzed again
+    self.records = {}
+    self.inventory_json = json.dumps({'files': {}})
+    # True when the last inventory file write failed
+    self.publish_failed = False
+    self._server = None
+  def scan(self):
+    '''Return filename to (template slug, mtime_ns, size) of every non-empty input file which currently exists'''
+    snapshot = {}
+    for template_slug, path in self.watched:
+      filenames = inputs.expand_directory(path) if os.path.isdir(path) else [path]
+      for filename in filenames:
+        try:
+          file_stat = os.stat(filename)
+        except OSError:
+          continue
+        if stat.S_ISREG(file_stat.st_mode) and file_stat.st_size:
+          snapshot[filename] = (template_slug, file_stat.st_mtime_ns, file_stat.st_size)
+    return snapshot
+  def poll(self):
+    '''Re-analyze the input files which changed since the previous poll and publish the inventory.  A file which cannot be analyzed is
+    logged and left out of the inventory until it changes again.  Returns True if anything changed'''
+    snapshot = self.scan()
+    changed = sorted(filename for filename, state in snapshot.items() if self.snapshot.get(filename) != state)
+    removed = [filename for filename in self.snapshot if filename not in snapshot]
+    if not changed and not removed:
+      if self.publish_failed:
+        self.publish()
+      return False
+    changed_records = []
+    for filename in changed:
+      template_slug = snapshot[filename][0]
+      if not inputs.is_archive(filename):
+        changed_records.append({'filename':filename, 'template':template_slug})
+        continue
+      try:
+        changed_records.extend(inputs.archive_records(filename, template_slug))
+      except inputs.READ_ERRORS as exc:
+        self.logger.warning("Failed to list members of archive %s, skipping it until it changes: %s", filename, exc)
+    # records of changed and removed files are dropped, including every member of an archive, before adding the new records
+    stale = set(changed).union(removed)
+    records = {filename: record for filename, record in self.records.items() if record.get('archive', filename) not in stale}
+    self.reaper.files = [records[filename] for filename in sorted(records)] + changed_records
+    if not self.reaper.preflight():
+      self.reaper.files = [self.records[filename] for filename in sorted(self.records)]
+      return False
+    indexed_records = self._index(changed_records)
+    records.update((record['filename'], record) for record in indexed_records)
+    self.reaper.files = [records[filename] for filename in sorted(records)]
+    self.reaper.resolve_orphans()
+    self.records = records
+    # files which failed are part of the snapshot too, so that they are only retried once they change
+    self.snapshot = snapshot
+    self.publish()
+    self.logger.info("Re-analyzed %s changed files, skipped %s files which failed, dropped %s removed files, %s files with %s orphans in inventory", len(indexed_records),
+      len(changed_records) - len(indexed_records), len(removed), len(records), sum(len(names) for record in records.values() for names in record['orphans'].values()))
+    return True
+  def _index(self, records):
+    '''Index records with the reaper, all together when possible, otherwise one at a time so that one bad file does not keep the
+    others out of the inventory.  Returns the records which were indexed'''
+    try:
+      if self.reaper.index_files(records):
+        return records
+    except Exception as exc:
+      self.logger.debug("Failed to analyze changed files together, retrying one at a time: %s", exc)
+    indexed_records = []
+    for record in records:
+      try:
+        indexed = self.reaper.index_files([record])
+      except Exception as exc:
+        self.logger.warning("Failed to analyze %s, skipping it until it changes: %s", record['filename'], exc)
+        continue
+      if indexed:
+        indexed_records.append(record)
+      else:
+        self.logger.warning("Failed to analyze %s, skipping it until it changes", record['filename'])
+    return indexed_records
+  def publish(self):
+    '''Rebuild the inventory JSON, and atomically rewrite the inventory file if one is configured.  A failed write is logged and
+    retried by the next poll'''
+    self.inventory_json = json.dumps({
+      'generated': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+      'files': {
+        filename: {
+          'template': record['template'],
+          'orphans': {slug: sorted(names) for slug, names in record['orphans'].items() if names},
+        } for filename, record in sorted(self.records.items())
+      },
+    }, indent=2)
+    self.publish_failed = False
+    if self.inventory_file:
+      try:
+        with inputs.atomic_write(self.inventory_file) as f:
+          f.write(self.inventory_json)
+      except OSError as exc:
+        self.logger.warning("Failed to write inventory file %s, retrying on the next poll: %s", self.inventory_file, exc)
+        self.publish_failed = True
+  def start_server(self):
+    '''Start serving the inventory on the Unix socket in a background thread.  A socket left behind at socket_path by an earlier run
+    is replaced, anything else there is left alone.  Returns False if the server could not be started'''
+    try:
+      existing = os.lstat(self.socket_path)
+    except FileNotFoundError:
+      existing = None
+    if existing:
+      if not stat.S_ISSOCK(existing.st_mode):
+        self.logger.error("Refusing to replace %s with the inventory socket, it exists and is not a socket", self.socket_path)
+        return False
+      os.remove(self.socket_path)
+    self._server = _InventoryServer(self.socket_path, _InventoryHandler)
+    self._server.watcher = self
+    threading.Thread(target=self._server.serve_forever, daemon=True).start()
+    self.logger.info("Serving orphan inventory on socket %s", self.socket_path)
+    return True
+  def stop_server(self):
+    if self._server:
+      self._server.shutdown()
+      self._server.server_close()
+      os.remove(self.socket_path)
+      self._server = None
+  def run(self, polls=None):
+    '''Poll every interval seconds until interrupted, or for the given number of polls.  Files which changed are analyzed by one
+    process pool kept open for the whole run when the reaper runs in parallel.  Returns False if the socket could not be served'''
+    if self.socket_path and not self.start_server():
+      return False
+    self.reaper.open_pool()
+    try:
+      while polls is None or polls > 0:
+        try:
+          self.poll()
+        except Exception:
+          # a long-running process outlives any one bad poll, the next poll starts from the last good snapshot
+          self.logger.exception("Poll failed, retrying in %s seconds", self.interval)
+        if polls is not None:
+          polls -= 1
+          if not polls:
+            break
+        time.sleep(self.interval)
+    except KeyboardInterrupt:
+      self.logger.info("Interrupted, stopping watch mode")
+    finally:
+      self.reaper.close_pool()
+      self.stop_server()
+    return True
@@ -0,0 +1,101 @@
+'''Tests of the on-disk result cache and how analysis results are keyed in it'''
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from orphanreaper import cache
+from orphanreaper import config
+from orphanreaper import reaper
+
+TEMPLATE_PATH = os.path.join(config.ROOT_DIR, 'templates', 'nxos.yaml')
+
+class ResultCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.cache_dir)
+  def test_key_depends_on_content_template_and_mode(self):
+    key = cache.ResultCache.key('digest', 'fingerprint', 'names')
+    self.assertEqual(key, cache.ResultCache.key('digest', 'fingerprint', 'names'))
+    self.assertNotEqual(key, cache.ResultCache.key('other', 'fingerprint', 'names'))
+    self.assertNotEqual(key, cache.ResultCache.key('digest', 'other', 'names'))
+    self.assertNotEqual(key, cache.ResultCache.key('digest', 'fingerprint', 'graph'))
+  def test_digest_lines(self):
+    lines = ['line %s' % number for number in range(10)]
+    self.assertEqual(cache.digest_lines(lines), cache.digest_lines(lines, batch_lines=3))
+    self.assertNotEqual(cache.digest_lines(['ab']), cache.digest_lines(['a', 'b']))
+    self.assertNotEqual(cache.digest_lines(['a']), cache.digest_lines(['a', '']))
+  def test_put_and_get(self):
+    result_cache = cache.ResultCache(self.cache_dir, 1 << 20)
+    self.assertIsNone(result_cache.get('ab' * 32))
+    result_cache.put('ab' * 32, {'objects': {}})
+    self.assertEqual(result_cache.get('ab' * 32), {'objects': {}})
+    self.assertEqual((result_cache.hits, result_cache.misses), (1, 1))
+  def test_evict_only_after_put(self):
+    for number in range(4):
+      cache.ResultCache(self.cache_dir, 1 << 20).put('%02d' % number * 32, {'pad': 'x' * 100})
+    result_cache = cache.ResultCache(self.cache_dir, 300)
+    # nothing was stored by this instance, so the cache directory is not scanned
+    self.assertEqual(result_cache.evict(), 0)
+    result_cache.put('04' * 32, {'pad': 'x' * 100})
+    self.assertEqual(result_cache.evict(), 3)
+    self.assertEqual(result_cache.evict(), 0)
+  def test_unreadable_entry_is_discarded(self):
+    result_cache = cache.ResultCache(self.cache_dir, 1 << 20)
+    path = result_cache._path('cd' * 32)
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+      f.write('{')
+    self.assertIsNone(result_cache.get('cd' * 32))
+    self.assertFalse(os.path.exists(path))
+
+class ReaperCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tmp_dir)
+    self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+    self.template_dir = os.path.join(self.tmp_dir, 'templates')
+    os.makedirs(self.template_dir)
+  def write_template(self, replace=None):
+    with open(TEMPLATE_PATH) as f:
+      contents = f.read()
+    if replace:
+      contents = contents.replace(*replace)
+    with open(os.path.join(self.template_dir, 'nxos.yaml'), 'w') as f:
+      f.write(contents)
+  def make_reaper(self, **kwargs):
+    config_path = os.path.join(self.tmp_dir, 'reaper.cfg.yaml')
+    with open(config_path, 'w') as f:
+      json.dump({'templates': [{'path_glob': os.path.join(self.template_dir, '*.yaml')}], 'cache': {'enabled': True, 'dir': self.cache_dir, 'max_size_mb': 1}}, f)
+    return reaper.Reaper(dcf=config_path, **kwargs)
+  def cache_key(self, lines, **kwargs):
+    file = {'filename':'r1', 'template':'nxos', 'lines':lines}
+    self.assertFalse(self.make_reaper(**kwargs)._load_cached_index(file))
+    return file['cache_key']
+  def test_key_depends_on_template_and_mode(self):
+    lines = ['ip prefix-list PL seq 5 permit 10.0.0.0/8']
+    self.write_template()
+    key = self.cache_key(lines)
+    self.assertEqual(key, self.cache_key(lines))
+    self.assertNotEqual(key, self.cache_key(lines + ['']))
+    self.assertNotEqual(key, self.cache_key(lines, transitive=True))
+    self.assertNotEqual(key, self.cache_key(lines, lineage=True))
+    self.write_template(('parser: native', 'parser: ciscoconfparse'))
+    self.assertNotEqual(key, self.cache_key(lines))
+    self.write_template(("'^ip prefix-list (?P<name>", "'^ip  *prefix-list (?P<name>"))
+    self.assertNotEqual(key, self.cache_key(lines))
+  def test_cached_result_is_reused(self):
+    self.write_template()
+    lines = ['ip prefix-list PL seq 5 permit 10.0.0.0/8', 'route-map RM permit 10']
+    first = self.make_reaper().analyze(lines, 'nxos')
+    second_reaper = self.make_reaper()
+    second = second_reaper.analyze(lines, 'nxos')
+    self.assertEqual((second_reaper.cache.hits, second_reaper.cache.misses), (1, 0))
+    self.assertEqual(second['orphans'], first['orphans'])
+  def test_template_which_fails_to_compile_is_fatal(self):
+    self.write_template(("'match as-path (?P<name>[a-zA-Z0-9_-]+)'", "'match as-path ([a-z]+)'"))
+    with self.assertRaises(config.ConfigError):
+      self.make_reaper()
+
+if __name__ == '__main__':
+  unittest.main()
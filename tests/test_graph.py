@@ -0,0 +1,31 @@
+'''Tests of the reference graph between configuration objects'''
+import unittest
+from orphanreaper import graph
+
+class ReferenceGraphTest(unittest.TestCase):
+  def test_unreachable(self):
+    reference_graph = graph.ReferenceGraph()
+    reference_graph.add_reference(None, ('acl', 'A'))
+    reference_graph.add_reference(('acl', 'A'), ('prefix', 'P'))
+    # B is only referenced from C, which nothing references
+    reference_graph.add_reference(('acl', 'C'), ('prefix', 'B'))
+    objects = {'acl': {'A', 'C'}, 'prefix': {'P', 'B', 'Q'}}
+    self.assertEqual(reference_graph.unreachable(objects), {'acl': {'C'}, 'prefix': {'B', 'Q'}})
+  def test_self_reference_does_not_make_reachable(self):
+    reference_graph = graph.ReferenceGraph()
+    reference_graph.add_reference(('acl', 'A'), ('acl', 'A'))
+    self.assertEqual(reference_graph.unreachable({'acl': {'A'}}), {'acl': {'A'}})
+  def test_cycle_is_unreachable(self):
+    reference_graph = graph.ReferenceGraph()
+    reference_graph.add_reference(('acl', 'A'), ('acl', 'B'))
+    reference_graph.add_reference(('acl', 'B'), ('acl', 'A'))
+    self.assertEqual(reference_graph.unreachable({'acl': {'A', 'B'}}), {'acl': {'A', 'B'}})
+  def test_round_trip(self):
+    reference_graph = graph.ReferenceGraph()
+    reference_graph.add_reference(None, ('acl', 'A'))
+    reference_graph.add_reference(('acl', 'A'), ('prefix', 'P'))
+    restored = graph.ReferenceGraph.from_dict(reference_graph.to_dict())
+    self.assertEqual((restored.edges, restored.roots), (reference_graph.edges, reference_graph.roots))
+
+if __name__ == '__main__':
+  unittest.main()
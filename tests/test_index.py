@@ -0,0 +1,29 @@
+'''Tests of the index of object names defined and referenced by input files'''
+import unittest
+from orphanreaper import graph
+from orphanreaper import index
+
+class NameIndexTest(unittest.TestCase):
+  def test_update_merges_names(self):
+    merged = index.NameIndex({'acl': {'A'}}, {'acl': {'B'}})
+    merged.update(index.NameIndex({'acl': {'B'}, 'prefix': {'P'}}, {'prefix': {'Q'}}))
+    self.assertEqual(merged.objects, {'acl': {'A', 'B'}, 'prefix': {'P'}})
+    self.assertEqual(merged.references, {'acl': {'B'}, 'prefix': {'Q'}})
+    self.assertIsNone(merged.graph)
+    self.assertEqual(merged.orphans(), {'acl': {'A'}, 'prefix': {'P'}})
+  def test_update_merges_graphs(self):
+    other_graph = graph.ReferenceGraph()
+    other_graph.add_reference(None, ('acl', 'A'))
+    merged = index.NameIndex({'acl': {'A', 'B'}})
+    merged.update(index.NameIndex({}, {'acl': {'A'}}, other_graph))
+    self.assertEqual(merged.orphans(transitive=True), {'acl': {'B'}})
+  def test_update_keeps_own_lineage(self):
+    merged = index.NameIndex({'acl': {'A'}}, lineage={'acl': {'A': (0, [])}})
+    merged.update(index.NameIndex({'acl': {'B'}}, lineage={'acl': {'B': (3, ['x'])}}))
+    self.assertEqual(merged.lineage, {'acl': {'A': (0, [])}})
+  def test_transitive_without_graph_raises(self):
+    with self.assertRaises(ValueError):
+      index.NameIndex({'acl': {'A'}}).orphans(transitive=True)
+
+if __name__ == '__main__':
+  unittest.main()
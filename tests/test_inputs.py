@@ -0,0 +1,92 @@
+'''Tests of reading compressed input files and the members of tar and zip archives'''
+import bz2
+import gzip
+import io
+import lzma
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import unittest.mock
+import zipfile
+from orphanreaper import inputs
+from orphanreaper import reaper
+
+CONFIG = 'ip prefix-list PL seq 5 permit 10.0.0.0/8\r\nroute-map RM permit 10\n'
+
+class InputsTest(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tmp_dir)
+  def path(self, name):
+    return os.path.join(self.tmp_dir, name)
+  def write_tar(self, name, members, mode='w:gz'):
+    with tarfile.open(self.path(name), mode) as archive:
+      for member, data in members:
+        info = tarfile.TarInfo(member)
+        info.size = len(data)
+        archive.addfile(info, io.BytesIO(data))
+    return self.path(name)
+  def test_open_text_decompresses(self):
+    for suffix, opener in (('.gz', gzip.open), ('.bz2', bz2.open), ('.xz', lzma.open), ('', open)):
+      with opener(self.path('r1.cfg' + suffix), 'wt') as f:
+        f.write(CONFIG)
+      with inputs.open_text(self.path('r1.cfg' + suffix)) as f:
+        self.assertEqual(reaper.read_lines(f), ['ip prefix-list PL seq 5 permit 10.0.0.0/8', 'route-map RM permit 10'], suffix)
+  def test_archive_records(self):
+    tar_path = self.write_tar('configs.tgz', [('r1.cfg', b'a\n'), ('empty.cfg', b''), ('sub/r2.cfg', b'b\n')])
+    records = inputs.archive_records(tar_path, 'nxos')
+    self.assertEqual([(record['filename'], record['member']) for record in records], [(os.path.join(tar_path, 'r1.cfg'), 'r1.cfg'), (os.path.join(tar_path, 'sub', 'r2.cfg'), 'sub/r2.cfg')])
+    self.assertTrue(all(isinstance(record['member_offset'], int) for record in records))
+    with zipfile.ZipFile(self.path('configs.zip'), 'w') as archive:
+      archive.writestr('sub/', '')
+      archive.writestr('sub/r1.cfg', 'a\n')
+    self.assertEqual([(record['member'], record['member_offset']) for record in inputs.archive_records(self.path('configs.zip'), 'nxos')], [('sub/r1.cfg', None)])
+  def test_tar_members_are_never_looked_up_by_name(self):
+    members = [('r%s.cfg' % number, ('hostname r%s\n' % number).encode()) for number in range(5)]
+    tar_path = self.write_tar('configs.tgz', members)
+    records = inputs.archive_records(tar_path, 'nxos')
+    reader = inputs.ArchiveReader()
+    self.addCleanup(reader.close)
+    with unittest.mock.patch.object(tarfile.TarFile, 'getmember', side_effect=AssertionError('member looked up by name')):
+      lines = [reader.read_lines(tar_path, record['member'], record['member_offset']) for record in records]
+      self.assertEqual(lines, [['hostname r%s' % number] for number in range(5)])
+      # going back to an earlier member still reads it, from the headers already read
+      self.assertEqual(reader.read_lines(tar_path, 'r1.cfg', records[1]['member_offset']), ['hostname r1'])
+  def test_duplicate_tar_member_names_are_told_apart_by_offset(self):
+    tar_path = self.write_tar('configs.tar', [('r1.cfg', b'first\n'), ('r1.cfg', b'second\n')], mode='w')
+    records = inputs.archive_records(tar_path, 'nxos')
+    reader = inputs.ArchiveReader()
+    self.addCleanup(reader.close)
+    self.assertEqual([reader.read_lines(tar_path, record['member'], record['member_offset']) for record in records], [['first'], ['second']])
+    self.assertEqual(reader.read_lines(tar_path, 'r1.cfg'), ['first'])
+  def test_compressed_members_are_decompressed(self):
+    compressed = [('r1.cfg.gz', gzip.compress(CONFIG.encode())), ('r2.cfg.bz2', bz2.compress(CONFIG.encode())), ('r3.cfg.xz', lzma.compress(CONFIG.encode()))]
+    tar_path = self.write_tar('configs.tar', compressed, mode='w')
+    with zipfile.ZipFile(self.path('configs.zip'), 'w') as archive:
+      for member, data in compressed:
+        archive.writestr(member, data)
+    reader = inputs.ArchiveReader()
+    self.addCleanup(reader.close)
+    for archive_path in (tar_path, self.path('configs.zip')):
+      for record in inputs.archive_records(archive_path, 'nxos'):
+        self.assertEqual(reader.read_lines(archive_path, record['member'], record['member_offset']), ['ip prefix-list PL seq 5 permit 10.0.0.0/8', 'route-map RM permit 10'])
+  def test_missing_member_is_a_read_error(self):
+    tar_path = self.write_tar('configs.tgz', [('r1.cfg', b'a\n')])
+    reader = inputs.ArchiveReader()
+    self.addCleanup(reader.close)
+    with self.assertRaises(inputs.READ_ERRORS):
+      reader.read_lines(tar_path, 'r2.cfg')
+  def test_undecodable_member_fails_its_file_only(self):
+    tar_path = self.write_tar('configs.tar', [('r1.cfg', CONFIG.encode()), ('r2.cfg', b'\xff\xfe\x00binary')], mode='w')
+    records = inputs.archive_records(tar_path, 'nxos')
+    files_reaper = reaper.Reaper(use_cache=False, template_artifact=False)
+    with self.assertLogs(level='ERROR') as logs:
+      self.assertFalse(files_reaper.index_files([records[1]]))
+    self.assertIn(records[1]['filename'], logs.output[0])
+    self.assertTrue(files_reaper.index_files([records[0]]))
+    self.assertEqual(records[0]['index'].objects['ip_prefix_list'], {'PL'})
+
+if __name__ == '__main__':
+  unittest.main()
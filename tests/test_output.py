@@ -0,0 +1,34 @@
+'''Tests of the machine-readable orphan output'''
+import io
+import json
+import unittest
+from orphanreaper import output
+
+class OrphanWriterTest(unittest.TestCase):
+  def write(self, output_format, files):
+    f = io.StringIO()
+    with output.OrphanWriter(f, output_format) as writer:
+      for file, lineage in files:
+        writer.write_file(file, lineage)
+    return f.getvalue()
+  def test_json_array_framing(self):
+    files = [
+      ({'filename':'a', 'template':'nxos', 'orphans':{}}, None),
+      ({'filename':'b', 'template':'nxos', 'orphans':{'acl': {'Y', 'X'}}}, {'acl': {'X': (4, ['vrf red'])}}),
+      ({'filename':'c', 'template':'nxos', 'orphans':{'acl': {'Z'}}}, None),
+    ]
+    records = json.loads(self.write('json', files))
+    self.assertEqual([(record['file'], record['name']) for record in records], [('b', 'X'), ('b', 'Y'), ('c', 'Z')])
+    self.assertEqual((records[0]['line'], records[0]['parent']), (5, ['vrf red']))
+    self.assertEqual((records[1]['line'], records[1]['parent']), (None, None))
+  def test_json_without_orphans_is_empty_array(self):
+    self.assertEqual(json.loads(self.write('json', [({'filename':'a', 'template':'nxos', 'orphans':{'acl': set()}}, None)])), [])
+  def test_ndjson_one_record_per_line(self):
+    text = self.write('ndjson', [({'filename':'a', 'template':'nxos', 'orphans':{'acl': {'X', 'Y'}}}, None)])
+    self.assertEqual([json.loads(line)['name'] for line in text.splitlines()], ['X', 'Y'])
+  def test_unknown_format_raises(self):
+    with self.assertRaises(ValueError):
+      output.OrphanWriter(io.StringIO(), 'xml')
+
+if __name__ == '__main__':
+  unittest.main()
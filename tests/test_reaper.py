@@ -0,0 +1,61 @@
+'''Tests of removal configlet generation'''
+import unittest
+from orphanreaper import graph
+from orphanreaper import reaper
+
+def reference_graph(*edges):
+  built = graph.ReferenceGraph()
+  for container, target in edges:
+    built.add_reference(container, target)
+  return built
+
+class RemovalOrderTest(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.reaper = reaper.Reaper(use_cache=False, template_artifact=False)
+    cls.template = cls.reaper.templates.get_compiled('nxos')
+  def order(self, orphans, edges=None):
+    file = {'filename':'r1', 'template':'nxos', 'orphans':orphans}
+    if edges is not None:
+      file['graph'] = reference_graph(*edges)
+    return self.reaper._removal_order(file, self.template)
+  def test_without_graph_follows_template_order(self):
+    orphans = {'route_map': {'RM-B', 'RM-A'}, 'ip_prefix_list': {'PL'}}
+    self.assertEqual(self.order(orphans), [('ip_prefix_list', 'PL'), ('route_map', 'RM-A'), ('route_map', 'RM-B')])
+  def test_referencing_orphan_comes_first(self):
+    orphans = {'route_map': {'RM'}, 'ip_prefix_list': {'PL', 'PL-OTHER'}}
+    edges = [(('route_map', 'RM'), ('ip_prefix_list', 'PL'))]
+    self.assertEqual(self.order(orphans, edges), [('ip_prefix_list', 'PL-OTHER'), ('route_map', 'RM'), ('ip_prefix_list', 'PL')])
+  def test_chain(self):
+    orphans = {'route_map': {'RM-A', 'RM-B'}, 'ip_prefix_list': {'PL'}}
+    edges = [(('route_map', 'RM-B'), ('route_map', 'RM-A')), (('route_map', 'RM-A'), ('ip_prefix_list', 'PL'))]
+    self.assertEqual(self.order(orphans, edges), [('route_map', 'RM-B'), ('route_map', 'RM-A'), ('ip_prefix_list', 'PL')])
+  def test_cycle_keeps_every_orphan(self):
+    orphans = {'route_map': {'RM-A', 'RM-B'}, 'ip_prefix_list': {'PL'}}
+    edges = [(('route_map', 'RM-A'), ('route_map', 'RM-B')), (('route_map', 'RM-B'), ('route_map', 'RM-A')), (('route_map', 'RM-B'), ('ip_prefix_list', 'PL'))]
+    self.assertEqual(self.order(orphans, edges), [('route_map', 'RM-A'), ('route_map', 'RM-B'), ('ip_prefix_list', 'PL')])
+  def test_orphan_referenced_from_cycle_follows_it(self):
+    orphans = {'route_map': {'RM-A', 'RM-B', 'RM-C'}}
+    # RM-A sorts first but is only referenced from the RM-B, RM-C cycle, so the cycle is broken at RM-B instead
+    edges = [(('route_map', 'RM-B'), ('route_map', 'RM-C')), (('route_map', 'RM-C'), ('route_map', 'RM-B')), (('route_map', 'RM-C'), ('route_map', 'RM-A'))]
+    self.assertEqual(self.order(orphans, edges), [('route_map', 'RM-B'), ('route_map', 'RM-C'), ('route_map', 'RM-A')])
+  def test_references_to_non_orphans_are_ignored(self):
+    orphans = {'ip_prefix_list': {'PL'}}
+    edges = [(('route_map', 'RM-USED'), ('ip_prefix_list', 'PL'))]
+    self.assertEqual(self.order(orphans, edges), [('ip_prefix_list', 'PL')])
+  def test_generate_configlet(self):
+    file = {'filename':'r1', 'template':'nxos', 'orphans':{'route_map': {'RM'}, 'ip_prefix_list': {'PL'}}, 'graph':reference_graph((('route_map', 'RM'), ('ip_prefix_list', 'PL')))}
+    self.assertEqual(list(self.reaper.generate_configlet(file)), ['! orphanreaper cleanup for r1', 'no route-map RM', 'no ip prefix-list PL'])
+
+class DeviceNamesTest(unittest.TestCase):
+  def device_names(self, filenames):
+    names_reaper = reaper.Reaper(use_cache=False, template_artifact=False, files=[{'filename':filename, 'template':'nxos'} for filename in filenames])
+    return names_reaper._device_names()
+  def test_basename(self):
+    self.assertEqual(self.device_names(['/configs/r1.cfg', '-']), {'/configs/r1.cfg': 'r1.cfg', '-': 'stdin'})
+  def test_colliding_basenames_use_relative_paths(self):
+    self.assertEqual(self.device_names(['/configs/r1.cfg', '/configs/sub/r1.cfg', '/configs/r2.cfg']),
+      {'/configs/r1.cfg': 'r1.cfg', '/configs/sub/r1.cfg': 'sub_r1.cfg', '/configs/r2.cfg': 'r2.cfg'})
+
+if __name__ == '__main__':
+  unittest.main()
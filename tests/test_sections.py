@@ -0,0 +1,66 @@
+'''Tests of the builders of the parent/child hierarchy of configuration lines'''
+import unittest
+from orphanreaper import sections
+
+try:
+  import ciscoconfparse
+except ImportError:
+  ciscoconfparse = None
+
+class _ConfigObj():
+  '''Stand-in for a ciscoconfparse object, numbered like ciscoconfparse numbers lines once blank lines are dropped'''
+  def __init__(self, linenum, text, parent=None):
+    self.linenum = linenum
+    self.text = text
+    self.parent = parent if parent is not None else self
+
+class _Tree():
+  def __init__(self, config_objs):
+    self.ConfigObjs = config_objs
+
+class DelimitedParentsTest(unittest.TestCase):
+  def parents(self, lines, opener='{', closer='}'):
+    return list(sections._delimited_parents(lines, opener, closer))
+  def test_nested_sections(self):
+    lines = ['a {', '  b {', '    c', '  }', '}', 'd']
+    self.assertEqual(self.parents(lines), [-1, 0, 1, 1, 0, -1])
+  def test_else_closes_and_reopens(self):
+    # `} else {` belongs to the section it closes and opens the next one
+    lines = ['if x {', '  y', '} else {', '  z', '}', 'w']
+    self.assertEqual(self.parents(lines), [-1, 0, 0, 2, 2, -1])
+  def test_closers_on_their_own_lines(self):
+    lines = ['a {', '  b {', '    c', '  }', '', '}', 'd']
+    self.assertEqual(self.parents(lines), [-1, 0, 1, 1, -1, 0, -1])
+  def test_one_line_opens_several_sections(self):
+    lines = ['a { b {', '  c', '} }', 'd']
+    self.assertEqual(self.parents(lines), [-1, 0, 0, -1])
+  def test_unbalanced_closer_is_ignored(self):
+    lines = ['}', 'a', 'b [', '  c', ']']
+    self.assertEqual(self.parents(lines, '[', ']'), [-1, -1, -1, 2, 2])
+
+class PrefixParentsTest(unittest.TestCase):
+  def test_lines_belong_to_previous_header(self):
+    lines = ['add name=x', '/ip firewall filter', 'add chain=input', '', '/interface', 'set ether1']
+    self.assertEqual(list(sections._prefix_parents(lines, '/')), [-1, -1, 1, -1, -1, 4])
+  def test_custom_prefix(self):
+    lines = ['# section', 'a', '# other', 'b']
+    self.assertEqual(list(sections._prefix_parents(lines, '#')), [-1, 0, -1, 2])
+
+class CiscoConfParseAlignmentTest(unittest.TestCase):
+  def test_blank_lines_dropped_and_renumbered(self):
+    lines = ['interface e1', '  description x', '', '  ip address 10.0.0.1/30', '', 'router bgp 1', '  neighbor a']
+    interface = _ConfigObj(0, 'interface e1')
+    router = _ConfigObj(3, 'router bgp 1')
+    tree = _Tree([interface, _ConfigObj(1, '  description x', interface), _ConfigObj(2, '  ip address 10.0.0.1/30', interface), router, _ConfigObj(4, '  neighbor a', router)])
+    self.assertEqual(list(sections.hierarchy_from_ciscoconfparse(tree, lines).parents), [-1, 0, -1, 0, -1, -1, 5])
+  def test_unaligned_object_raises(self):
+    with self.assertRaises(ValueError):
+      sections.hierarchy_from_ciscoconfparse(_Tree([_ConfigObj(0, 'not in lines')]), ['interface e1'])
+  @unittest.skipUnless(ciscoconfparse, 'ciscoconfparse is not installed')
+  def test_matches_native_indent_parser(self):
+    lines = ['interface e1', '  description x', '', '  ip address 10.0.0.1/30', '', 'router bgp 1', '  neighbor a', '   remote-as 2']
+    tree = ciscoconfparse.CiscoConfParse(config=lines)
+    self.assertEqual(list(sections.hierarchy_from_ciscoconfparse(tree, lines).parents), list(sections.build_hierarchy(lines, 'indent').parents))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,127 @@
+'''Tests of template compilation and the single-pass line classifier'''
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+import yaml
+from orphanreaper import config
+from orphanreaper import reaper
+from orphanreaper import templates
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'templates')
+
+CONFIG_LINES = [
+  'ip prefix-list PL-USED seq 5 permit 10.0.0.0/8',
+  'ip prefix-list PL-UNUSED seq 5 permit 10.1.0.0/16',
+  'ipv6 prefix-list PL6 seq 5 permit ::/0',
+  'ip as-path access-list AS-1 seq 10 permit "^65000$"',
+  'ip community-list standard CL-1 seq 10 permit 65000:1',
+  'ip access-list ACL-MGMT',
+  '  10 permit ip 10.0.0.0/8 any',
+  'route-map RM-IN permit 10',
+  '  match ip address prefix-list PL-USED PL-OTHER',
+  '  match as-path AS-1',
+  '  match community-list CL-1',
+  'route-map RM-UNUSED permit 10',
+  'interface Ethernet1/1',
+  '  ip access-group ACL-MGMT in',
+  'router bgp 65000',
+  '  neighbor 10.0.0.2',
+  '    address-family ipv4 unicast',
+  '      route-map RM-IN in',
+  '      suppress-map RM-IN attribute-map RM-UNUSED',
+  'line vty',
+  '  access-class ACL-MGMT in',
+]
+
+def per_definition_scan(template_contents, lines):
+  '''Classify lines the way templates did before the single-pass scan: every object regex searched over every line, then every
+  reference regex, skipping lines which define the object'''
+  objects = {obj_def['slug']: set() for obj_def in template_contents['objects']}
+  references = {obj_def['slug']: set() for obj_def in template_contents['objects']}
+  for obj_def in template_contents['objects']:
+    for line in lines:
+      name_match = re.search(obj_def['regex'], line)
+      if name_match:
+        objects[obj_def['slug']].add(name_match.group('name'))
+    for reference_def in obj_def.get('references') or []:
+      for line in lines:
+        if re.search(obj_def['regex'], line):
+          continue
+        for name_match in re.finditer(reference_def['regex'], line):
+          references[obj_def['slug']].add(name_match.group('name'))
+  return objects, references
+
+def scan_names(template, lines):
+  objects = {obj_def['slug']: set() for obj_def, obj_regex, references in template.objects}
+  references = {obj_def['slug']: set() for obj_def, obj_regex, references in template.objects}
+  for line_number, obj_def, name, reference_def in template.scan(lines):
+    (objects if reference_def is None else references)[obj_def['slug']].add(name)
+  return objects, references
+
+def template_contents(objects):
+  return {'meta': {'name': 'test', 'slug': 'test', 'section': 'indent'}, 'objects': objects}
+
+class TemplateScanTest(unittest.TestCase):
+  def test_matches_per_definition_scan(self):
+    with open(os.path.join(TEMPLATE_DIR, 'nxos.yaml')) as f:
+      contents = yaml.safe_load(f)
+    template = templates.Template(contents)
+    self.assertIsNotNone(template.prefilter)
+    self.assertEqual(scan_names(template, CONFIG_LINES), per_definition_scan(contents, CONFIG_LINES))
+  def test_line_numbers(self):
+    template = templates.Template(template_contents([{'name': 'acl', 'slug': 'acl', 'regex': '^acl (?P<name>\\w+)', 'references': [{'name': 'use', 'regex': 'use (?P<name>\\w+)'}]}]))
+    matches = [(line_number, name, reference_def['name'] if reference_def else None) for line_number, obj_def, name, reference_def in template.scan(['x', 'acl A', ' use A use B'])]
+    self.assertEqual(matches, [(1, 'A', None), (2, 'A', 'use'), (2, 'B', 'use')])
+  def test_backreferences_disable_prefilter(self):
+    for regex in ['^acl (?P<q>"?)(?P<name>\\w+)(?P=q)', '^acl (")(?P<name>\\w+)\\1', '^acl (?P<q>")?(?P<name>\\w+)(?(q)")']:
+      contents = template_contents([{'name': 'acl', 'slug': 'acl', 'regex': regex, 'references': [{'name': 'use', 'regex': 'use (?P<name>\\w+)'}]}])
+      template = templates.Template(contents)
+      self.assertIsNone(template.prefilter, regex)
+      lines = ['acl "A"', 'acl B', 'use A', 'x']
+      self.assertEqual(scan_names(template, lines), per_definition_scan(contents, lines), regex)
+  def test_escaped_backslash_keeps_prefilter(self):
+    template = templates.Template(template_contents([{'name': 'acl', 'slug': 'acl', 'regex': '^acl \\\\1(?P<name>\\w+)'}]))
+    self.assertIsNotNone(template.prefilter)
+    self.assertEqual(scan_names(template, ['acl \\1A', 'acl 1B']), ({'acl': {'A'}}, {'acl': set()}))
+  def test_regex_without_name_group_raises(self):
+    with self.assertRaises(ValueError):
+      templates.Template(template_contents([{'name': 'acl', 'slug': 'acl', 'regex': '^acl (\\w+)'}]))
+
+class TemplateArtifactTest(unittest.TestCase):
+  def setUp(self):
+    self.artifact_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.artifact_dir)
+  def load(self, artifact_dir):
+    reaper_config = config.Config(None)
+    reaper_config.load()
+    loaded = templates.Templates(reaper_config, artifact_dir=artifact_dir)
+    self.assertTrue(loaded.load())
+    return loaded
+  def test_artifact_is_json_and_skips_yaml(self):
+    from_files = self.load(self.artifact_dir)
+    with open(os.path.join(self.artifact_dir, 'templates.json')) as f:
+      self.assertEqual(json.load(f)['sources'][0], templates.ARTIFACT_FORMAT)
+    with unittest.mock.patch.object(templates, 'yaml', unittest.mock.Mock(safe_load=unittest.mock.Mock(side_effect=AssertionError('template files were parsed')))):
+      from_artifact = self.load(self.artifact_dir)
+    self.assertEqual(from_artifact.index, from_files.index)
+    self.assertEqual(from_artifact.get_compiled('nxos').fingerprint, from_files.get_compiled('nxos').fingerprint)
+    self.assertEqual(scan_names(from_artifact.get_compiled('nxos'), CONFIG_LINES), scan_names(from_files.get_compiled('nxos'), CONFIG_LINES))
+  def test_malformed_artifact_is_ignored(self):
+    self.load(self.artifact_dir)
+    path = os.path.join(self.artifact_dir, 'templates.json')
+    with open(path) as f:
+      artifact = json.load(f)
+    artifact['file_contents'] = [{'nxos.yaml': {'meta': {}}}]
+    with open(path, 'w') as f:
+      json.dump(artifact, f)
+    self.assertIn('nxos', self.load(self.artifact_dir).compiled)
+  def test_reaper_without_template_artifact_writes_nothing(self):
+    reaper.Reaper(use_cache=False, cache_dir=self.artifact_dir, template_artifact=False)
+    self.assertEqual(os.listdir(self.artifact_dir), [])
+
+if __name__ == '__main__':
+  unittest.main()